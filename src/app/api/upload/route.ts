@@ -28,7 +28,12 @@ export async function POST(req: Request) {
     try {
       const upstreamForm = new FormData();
       upstreamForm.append("file", file, file.name);
-      const upstreamRes = await fetch(UPSTREAM_URL, { method: "POST", body: upstreamForm });
+      const upstreamRes = await fetch(UPSTREAM_URL, {
+        method: "POST",
+        body: upstreamForm,
+        // lets the extractor schedule fairly per user
+        headers: { "X-User-Id": String(session.user.id) },
+      });
       if (upstreamRes.ok) {
         extracted = await upstreamRes.json();
       } else {
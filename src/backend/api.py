@@ -1,35 +1,332 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, send_file
 from flask_cors import CORS
-import os, tempfile
-from resume_extractor import extract_any
+import os, hashlib, tempfile
+from resume_extractor import extract_any, estimate_cost, profile_expectations, PROFILES, DEFAULT_PROFILE, PDF_TEXT_BACKENDS, _rss_mb, _max_rss_mb
+from sandbox import SandboxPool, SandboxError
+from scheduler import FairScheduler, Overloaded
+import singleflight
+import profiling
+from chunked_upload import UploadSession, OffsetMismatch, parse_content_range
+from jobqueue import JobQueue
+from private_dir import UnsafeDirectory
+
+try:
+    import psutil
+except Exception:
+    psutil = None
 
 app = Flask(__name__)
 CORS(app)
 
-@app.post("/upload")
-def upload():
+# EXTRACT_SANDBOX=1 runs every extraction in a recycled, rlimited child process.
+_sandbox = SandboxPool() if os.getenv("EXTRACT_SANDBOX", "0") == "1" else None
+
+_scheduler = FairScheduler()
+
+# Durable queue for POST /extract-jobs; run `python jobqueue.py worker` on any host sharing JOBQUEUE_DB.
+_jobs = JobQueue()
+
+# PROFILE_SAMPLE_HZ > 0 keeps a low-rate stack sampler running for the process lifetime.
+_sampler = profiling.start_background_sampler()
+
+def _extract(path: str, **kwargs):
+    if _sandbox is not None:
+        return _sandbox.run(path, **kwargs)
+    return extract_any(path, **kwargs)
+
+# OCR language pack(s) when the caller does not pass ?lang=; "auto" detects it per document.
+DEFAULT_LANG = os.getenv("OCR_DEFAULT_LANG", "eng")
+
+# Cost charged when a file cannot be triaged up front: large, so it never jumps the small-job queue.
+UNKNOWN_JOB_COST = 60.0
+
+def _job_cost(path: str, profile=None) -> float:
+    try:
+        return estimate_cost(path, profile)["predicted_seconds"]
+    except Exception:
+        return UNKNOWN_JOB_COST
+
+def _busy_payload(retry_after: int, message: str):
+    return {"error": message, "retry_after": retry_after}, 503, {"Retry-After": str(retry_after)}
+
+def _shed_payload():
+    """A 503 before the upload body is read. The cost is unknown here, so only when
+    even a small job would be shed; larger ones are decided once costed."""
+    if _scheduler.admit_timeout > 0:
+        return None  # callers may queue for a slot; decide once the job is costed
+    retry_after = _scheduler.retry_after()
+    return None if retry_after is None else _busy_payload(retry_after, "Server busy; retry later")
+
+def _shed_early():
+    busy = _shed_payload()
+    if busy is None:
+        return None
+    body, status, headers = busy
+    return jsonify(body), status, headers
+
+def _user_key(headers=None, remote=None) -> str:
+    # The Next.js proxy forwards the session user; direct callers fall back to their address.
+    if headers is None:
+        headers, remote = request.headers, request.remote_addr
+    return headers.get("X-User-Id") or remote or "anonymous"
+
+def _save_upload():
+    """Spool the multipart 'file' field to a temp file, hashing it on the way.
+    Returns (path, sha256, None) or (None, None, error response)."""
     if "file" not in request.files:
-        return jsonify(error="No file part"), 400
+        return None, None, (jsonify(error="No file part"), 400)
     f = request.files["file"]
     if not f or not f.filename:
-        return jsonify(error="No filename"), 400
+        return None, None, (jsonify(error="No filename"), 400)
 
     suffix = os.path.splitext(f.filename)[1].lower()
+    digest = hashlib.sha256()
     with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tmp:
-        f.save(tmp.name)
-        tmp_path = tmp.name
+        for chunk in iter(lambda: f.stream.read(1 << 20), b""):
+            digest.update(chunk)
+            tmp.write(chunk)
+        return tmp.name, digest.hexdigest(), None
+
+def _remove(path: str) -> None:
+    try:
+        os.remove(path)
+    except Exception:
+        pass
+
+def _page_range(spec):
+    """'2', '1-3', '3-' or '-2' -> (first, last); None when absent or malformed,
+    like Flask's own type= conversion."""
+    if not spec:
+        return None
+    first, sep, last = spec.partition("-")
+    if not sep:
+        last = first
+    try:
+        return (int(first) if first else None, int(last) if last else None)
+    except ValueError:
+        return None
+
+def _int_arg(value):
+    try:
+        return int(value) if value is not None else None
+    except ValueError:
+        return None
+
+def _request_options(args=None):
+    args = request.args if args is None else args
+    return {"lang": args.get("lang", DEFAULT_LANG),
+            "text_backend": args.get("text_backend"),
+            "structured": args.get("structured") == "1",
+            # unset falls back to the OCR_TWO_PASS default of the extractor
+            "two_pass": {"1": True, "0": False}.get(args.get("two_pass")),
+            # screening only needs the first pages / characters of a long upload
+            "page_range": _page_range(args.get("pages")),
+            "max_chars": _int_arg(args.get("max_chars")),
+            # fast | balanced | accurate; unset uses the deployment's EXTRACT_PROFILE
+            "profile": args.get("profile")}
+
+def _bad_options(args=None):
+    """An error message for options no extraction could honour, checked before the
+    upload is read; None when they are fine."""
+    args = request.args if args is None else args
+    profile = args.get("profile")
+    if profile is not None and profile not in PROFILES:
+        return f"Unknown profile {profile!r}; use one of {', '.join(PROFILES)}"
+    backend = args.get("text_backend")
+    if backend is not None and backend not in PDF_TEXT_BACKENDS:
+        return f"Unknown text_backend {backend!r}; use one of {', '.join(PDF_TEXT_BACKENDS)}"
+    max_chars = _int_arg(args.get("max_chars"))
+    if max_chars is not None and max_chars <= 0:
+        return f"max_chars must be positive, not {max_chars}"
+    return None
+
+def _run_extraction(path: str, digest: str, opts, user: str, profiled: bool = False):
+    """The extraction result as a response body. Blocks until a scheduler slot has run it;
+    the async server calls this from its executor."""
+    profile_id = None
+    if profiled:
+        # profiled runs stay in this process (no sandbox) and are never deduplicated
+        res, profile_id = _scheduler.run(user, _job_cost(path, opts.get("profile")), profiling.profile_call,
+                                         extract_any, path, doc_hash=digest, **opts)
+        shared = False
+    else:
+        # identical concurrent uploads (double clicks, client retries) share one extraction
+        res, shared = singleflight.run(
+            singleflight.flight_key(digest, **opts),
+            lambda: _scheduler.run(user, _job_cost(path, opts.get("profile")), _extract, path, doc_hash=digest, **opts))
+    out = dict(text=res["text"], meta=res["meta"], warnings=res["warnings"], deduplicated=shared)
+    if "words" in res:
+        out["words"] = res["words"]
+    if profile_id:
+        out["profile_id"] = profile_id
+    return out
 
+def _error_payload(e: Exception):
+    """(body, status, headers) for an extraction that raised; a profiled run that
+    failed still names its profile."""
+    if isinstance(e, Overloaded):
+        body, status, headers = _busy_payload(e.retry_after, str(e))
+    elif isinstance(e, SandboxError):
+        body, status, headers = {"error": str(e), "sandbox": e.to_dict()}, e.status, {}
+    else:
+        body, status, headers = {"error": str(e)}, 500, {}
+    if getattr(e, "profile_id", None):
+        body["profile_id"] = e.profile_id
+    return body, status, headers
+
+def _extraction_response(path: str, digest: str, opts):
     try:
-        lang = request.args.get("lang", "eng")
-        res = extract_any(tmp_path, lang=lang)
-        return jsonify(text=res["text"], meta=res["meta"], warnings=res["warnings"])
+        return jsonify(_run_extraction(path, digest, opts, _user_key(), profiling.requested(request)))
+    except Exception as e:
+        body, status, headers = _error_payload(e)
+        return jsonify(body), status, headers
+
+@app.post("/upload")
+def upload():
+    bad = _bad_options()
+    if bad:
+        return jsonify(error=bad), 400
+    busy = _shed_early()
+    if busy:
+        return busy
+    tmp_path, digest, err = _save_upload()
+    if err:
+        return err
+
+    try:
+        return _extraction_response(tmp_path, digest, _request_options())
+    finally:
+        _remove(tmp_path)
+
+@app.post("/uploads")
+def upload_create():
+    filename = request.args.get("filename")
+    if not filename:
+        return jsonify(error="No filename"), 400
+    bad = _bad_options()
+    if bad:
+        return jsonify(error=bad), 400
+    busy = _shed_early()
+    if busy:
+        return busy
+    size = request.args.get("size", type=int)
+    try:
+        sess = UploadSession.create(filename, size, _request_options())
+    except UnsafeDirectory as e:
+        return jsonify(error=f"Upload spool unavailable: {e}"), 503
+    return jsonify(sess.status()), 201
+
+@app.get("/uploads/<upload_id>")
+def upload_status(upload_id: str):
+    sess = UploadSession.load(upload_id)
+    if sess is None:
+        return jsonify(error="Unknown upload"), 404
+    return jsonify(sess.status())
+
+@app.put("/uploads/<upload_id>")
+def upload_chunk(upload_id: str):
+    sess = UploadSession.load(upload_id)
+    if sess is None:
+        return jsonify(error="Unknown upload"), 404
+    try:
+        start, size = parse_content_range(request.headers.get("Content-Range"))
+        sess.write(request.stream, start, size)
+    except OffsetMismatch as e:
+        return jsonify(error=str(e), **sess.status()), 409
+    except ValueError as e:
+        return jsonify(error=str(e)), 400
+    if not sess.complete:
+        return jsonify(sess.status())
+
+    # last chunk: the hash is already known, extract straight from the spool file
+    resp = _extraction_response(sess.path, sess.digest(), sess.options)
+    if not (isinstance(resp, tuple) and resp[1] == 503):
+        sess.discard()  # a shed upload is kept: re-sending the empty final chunk retries it
+    return resp
+
+@app.post("/estimate")
+def estimate():
+    bad = _bad_options()
+    if bad:
+        return jsonify(error=bad), 400
+    tmp_path, _, err = _save_upload()
+    if err:
+        return err
+
+    try:
+        return jsonify(estimate_cost(tmp_path, request.args.get("profile")))
     except Exception as e:
         return jsonify(error=str(e)), 500
     finally:
+        _remove(tmp_path)
+
+def _children_rss_mb():
+    # sandbox children and the OCR pool live outside this process's own RSS
+    if psutil is None:
+        return None
+    total = 0
+    for child in psutil.Process().children(recursive=True):
         try:
-            os.remove(tmp_path)
-        except Exception:
+            total += child.memory_info().rss
+        except psutil.Error:
             pass
+    return round(total / 2**20, 1)
+
+@app.post("/extract-jobs")
+def extract_job_create():
+    bad = _bad_options()
+    if bad:
+        return jsonify(error=bad), 400
+    tmp_path, digest, err = _save_upload()
+    if err:
+        return err
+
+    try:
+        job_id = _jobs.enqueue(tmp_path, dict(_request_options(), doc_hash=digest))
+    except Exception as e:
+        return jsonify(error=str(e)), 500
+    finally:
+        _remove(tmp_path)
+    return jsonify(job_id=job_id, status="queued"), 202, {"Location": f"/extract-jobs/{job_id}"}
+
+@app.get("/extract-jobs/<job_id>")
+def extract_job_status(job_id: str):
+    job = _jobs.get(job_id)
+    if job is None:
+        return jsonify(error="Unknown job"), 404
+    return jsonify(job)
+
+@app.get("/extract-profiles")
+def extract_profiles():
+    return jsonify(_profiles_payload())
+
+def _stats_payload():
+    rss = _rss_mb()
+    return dict(pid=os.getpid(), rss_mb=round(rss, 1) if rss is not None else None,
+                max_rss_mb=_max_rss_mb(), children_rss_mb=_children_rss_mb(),
+                scheduler=_scheduler.stats(), jobs=_jobs.stats())
+
+def _profiles_payload():
+    exp = profile_expectations()
+    return dict(default=DEFAULT_PROFILE,
+                profiles={name: dict(exp[name], settings=PROFILES[name]) for name in PROFILES})
+
+@app.get("/stats")
+def stats():
+    return jsonify(_stats_payload())
+
+@app.get("/profiles/<profile_id>")
+def profile_download(profile_id: str):
+    if not profiling.requested(request):
+        return jsonify(error="Not found"), 404
+    fmt = request.args.get("format", "prof")
+    path = profiling.profile_path(profile_id, fmt)
+    if path is None:
+        return jsonify(error="Unknown profile"), 404
+    if fmt == "txt":
+        return send_file(path, mimetype="text/plain")
+    return send_file(path, mimetype="application/octet-stream", as_attachment=True,
+                     download_name=f"{profile_id}.prof")
 
 if __name__ == "__main__":
     # Optional envs (Windows):
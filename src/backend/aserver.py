@@ -0,0 +1,258 @@
+"""Async serving mode: the api.py routes on an aiohttp event loop.
+
+    pip install -r requirements.txt     # includes the optional aiohttp
+    python aserver.py [--host 0.0.0.0] [--port 5000]
+
+Request and response bodies are moved by the event loop, so a client trickling a
+30 MB scan over a mobile link, or reading the result slowly, costs an open socket
+rather than a worker. Uploads stream to a temp file (hashed on the way) and only the
+blocking part (single-flight, the fair scheduler and extract_any) runs in a bounded
+thread pool of ASYNC_EXTRACT_THREADS through run_in_executor. Scheduling, admission
+control, sandboxing, the job queue and every response body are api.py's own, so
+both servers behave the same; one process here replaces a pool of sync workers.
+
+Chunked-upload PUT bodies stream into the spool file too: UploadSession.write runs
+in one of ASYNC_UPLOAD_THREADS threads and pulls the body from the loop a megabyte at
+a time, so neither the chunk nor the spool file's lock ever blocks the loop.
+"""
+import argparse, asyncio, hashlib, os, tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+from aiohttp import web
+
+import api
+import profiling
+from chunked_upload import UploadSession, OffsetMismatch, parse_content_range
+from private_dir import UnsafeDirectory
+from resume_extractor import estimate_cost
+
+ASYNC_EXTRACT_THREADS = int(os.getenv("ASYNC_EXTRACT_THREADS", str(4 * api._scheduler.workers)))
+ASYNC_UPLOAD_THREADS = int(os.getenv("ASYNC_UPLOAD_THREADS", "32"))
+
+# threads mostly wait on scheduler slots or single-flight locks; the scheduler bounds the CPU work
+_executor = ThreadPoolExecutor(max_workers=ASYNC_EXTRACT_THREADS, thread_name_prefix="aextract")
+# chunk writers wait on the client; kept apart so slow uploads never hold up extractions
+_uploads = ThreadPoolExecutor(max_workers=ASYNC_UPLOAD_THREADS, thread_name_prefix="aupload")
+
+class _BodyStream:
+    """A blocking read() over a request body, for a thread of _uploads."""
+
+    def __init__(self, request: web.Request, loop: asyncio.AbstractEventLoop):
+        self.content = request.content
+        self.loop = loop
+
+    def read(self, n: int = -1) -> bytes:
+        return asyncio.run_coroutine_threadsafe(self.content.read(n if n > 0 else 1 << 20), self.loop).result()
+
+def _json(body, status: int = 200, headers=None) -> web.Response:
+    return web.json_response(body, status=status, headers=headers)
+
+def _user_key(request: web.Request) -> str:
+    return api._user_key(request.headers, request.remote)
+
+def _profiled(request: web.Request) -> bool:
+    return profiling.authorized(request.headers.get("X-Profile-Token"))
+
+def _bad_options(request: web.Request):
+    bad = api._bad_options(request.query)
+    return None if bad is None else _json({"error": bad}, 400)
+
+def _shed_early():
+    busy = api._shed_payload()
+    return None if busy is None else _json(*busy)
+
+async def _blocking(fn, *args):
+    return await asyncio.get_running_loop().run_in_executor(_executor, fn, *args)
+
+async def _quick(fn, *args):
+    # short SQLite/psutil calls: the loop's default pool, so they never queue behind extractions
+    return await asyncio.get_running_loop().run_in_executor(None, fn, *args)
+
+async def _upload_io(fn, *args):
+    return await asyncio.get_running_loop().run_in_executor(_uploads, fn, *args)
+
+async def _save_upload(request: web.Request):
+    """Stream the multipart 'file' field to a temp file.
+    Returns (path, sha256, None) or (None, None, error response)."""
+    try:
+        reader = await request.multipart()
+    except (AssertionError, ValueError):
+        return None, None, _json({"error": "No file part"}, 400)
+    while True:
+        part = await reader.next()
+        if part is None:
+            return None, None, _json({"error": "No file part"}, 400)
+        if part.name == "file":
+            break
+    if not part.filename:
+        return None, None, _json({"error": "No filename"}, 400)
+
+    suffix = os.path.splitext(part.filename)[1].lower()
+    digest = hashlib.sha256()
+    with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tmp:
+        try:
+            while True:
+                chunk = await part.read_chunk(1 << 20)
+                if not chunk:
+                    break
+                digest.update(chunk)
+                tmp.write(chunk)
+        except BaseException:
+            tmp.close()
+            api._remove(tmp.name)  # client went away mid-upload
+            raise
+        return tmp.name, digest.hexdigest(), None
+
+async def _extraction_response(request: web.Request, path: str, digest: str, opts) -> web.Response:
+    try:
+        out = await _blocking(api._run_extraction, path, digest, opts, _user_key(request), _profiled(request))
+    except Exception as e:
+        return _json(*api._error_payload(e))
+    return _json(out)
+
+async def upload(request: web.Request) -> web.Response:
+    busy = _bad_options(request) or _shed_early()
+    if busy:
+        return busy
+    path, digest, err = await _save_upload(request)
+    if err:
+        return err
+    try:
+        return await _extraction_response(request, path, digest, api._request_options(request.query))
+    finally:
+        api._remove(path)
+
+async def upload_create(request: web.Request) -> web.Response:
+    filename = request.query.get("filename")
+    if not filename:
+        return _json({"error": "No filename"}, 400)
+    busy = _bad_options(request) or _shed_early()
+    if busy:
+        return busy
+    try:
+        sess = await _upload_io(UploadSession.create, filename, api._int_arg(request.query.get("size")),
+                                api._request_options(request.query))
+    except UnsafeDirectory as e:
+        return _json({"error": f"Upload spool unavailable: {e}"}, 503)
+    return _json(sess.status(), 201)
+
+async def upload_status(request: web.Request) -> web.Response:
+    sess = await _upload_io(UploadSession.load, request.match_info["upload_id"])
+    if sess is None:
+        return _json({"error": "Unknown upload"}, 404)
+    return _json(sess.status())
+
+async def upload_chunk(request: web.Request) -> web.Response:
+    sess = await _upload_io(UploadSession.load, request.match_info["upload_id"])
+    if sess is None:
+        return _json({"error": "Unknown upload"}, 404)
+    try:
+        start, size = parse_content_range(request.headers.get("Content-Range"))
+        await _upload_io(sess.write, _BodyStream(request, asyncio.get_running_loop()), start, size)
+    except OffsetMismatch as e:
+        return _json({"error": str(e), **sess.status()}, 409)
+    except ValueError as e:
+        return _json({"error": str(e)}, 400)
+    if not sess.complete:
+        return _json(sess.status())
+
+    digest = await _upload_io(sess.digest)  # usually the running hash; a rehash after another worker wrote
+    resp = await _extraction_response(request, sess.path, digest, sess.options)
+    if resp.status != 503:
+        await _upload_io(sess.discard)  # a shed upload is kept: re-sending the empty final chunk retries it
+    return resp
+
+async def estimate(request: web.Request) -> web.Response:
+    bad = _bad_options(request)
+    if bad:
+        return bad
+    path, _, err = await _save_upload(request)
+    if err:
+        return err
+    try:
+        return _json(await _blocking(estimate_cost, path, request.query.get("profile")))
+    except Exception as e:
+        return _json({"error": str(e)}, 500)
+    finally:
+        api._remove(path)
+
+async def extract_job_create(request: web.Request) -> web.Response:
+    bad = _bad_options(request)
+    if bad:
+        return bad
+    path, digest, err = await _save_upload(request)
+    if err:
+        return err
+    try:
+        opts = dict(api._request_options(request.query), doc_hash=digest)
+        job_id = await _quick(api._jobs.enqueue, path, opts)
+    except Exception as e:
+        return _json({"error": str(e)}, 500)
+    finally:
+        api._remove(path)
+    return _json({"job_id": job_id, "status": "queued"}, 202, {"Location": f"/extract-jobs/{job_id}"})
+
+async def extract_job_status(request: web.Request) -> web.Response:
+    job = await _quick(api._jobs.get, request.match_info["job_id"])
+    if job is None:
+        return _json({"error": "Unknown job"}, 404)
+    return _json(job)
+
+async def extract_profiles(request: web.Request) -> web.Response:
+    return _json(api._profiles_payload())
+
+async def stats(request: web.Request) -> web.Response:
+    out = await _quick(api._stats_payload)
+    # pending counts callers waiting for an executor thread, ahead of the scheduler queue
+    out["async"] = {"threads": ASYNC_EXTRACT_THREADS, "pending": _executor._work_queue.qsize()}
+    return _json(out)
+
+async def profile_download(request: web.Request) -> web.StreamResponse:
+    if not _profiled(request):
+        return _json({"error": "Not found"}, 404)
+    profile_id = request.match_info["profile_id"]
+    fmt = request.query.get("format", "prof")
+    path = profiling.profile_path(profile_id, fmt)
+    if path is None:
+        return _json({"error": "Unknown profile"}, 404)
+    if fmt == "txt":
+        return web.FileResponse(path, headers={"Content-Type": "text/plain"})
+    return web.FileResponse(path, headers={"Content-Type": "application/octet-stream",
+                                           "Content-Disposition": f'attachment; filename="{profile_id}.prof"'})
+
+async def _preflight(request: web.Request) -> web.Response:
+    return web.Response(headers={
+        "Access-Control-Allow-Methods": request.headers.get("Access-Control-Request-Method", "*"),
+        "Access-Control-Allow-Headers": request.headers.get("Access-Control-Request-Headers", "*")})
+
+@web.middleware
+async def _cors(request: web.Request, handler):
+    # the same permissive policy flask_cors gives api.py
+    resp = await handler(request)
+    resp.headers["Access-Control-Allow-Origin"] = "*"
+    return resp
+
+def make_app() -> web.Application:
+    app = web.Application(middlewares=[_cors])
+    app.router.add_post("/upload", upload)
+    app.router.add_post("/uploads", upload_create)
+    app.router.add_get("/uploads/{upload_id}", upload_status)
+    app.router.add_put("/uploads/{upload_id}", upload_chunk)
+    app.router.add_post("/estimate", estimate)
+    app.router.add_post("/extract-jobs", extract_job_create)
+    app.router.add_get("/extract-jobs/{job_id}", extract_job_status)
+    app.router.add_get("/extract-profiles", extract_profiles)
+    app.router.add_get("/stats", stats)
+    app.router.add_get("/profiles/{profile_id}", profile_download)
+    app.router.add_route("OPTIONS", "/{tail:.*}", _preflight)
+    return app
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--host", default="0.0.0.0")
+    ap.add_argument("--port", type=int, default=5000)
+    args = ap.parse_args()
+    web.run_app(make_app(), host=args.host, port=args.port)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+"""Micro-benchmarks for the extraction pipeline.
+
+    python bench.py text-backends path/to/corpus [more.pdf ...] [--repeat 3]
+    python bench.py blank-pages [--sheets 10]
+    python bench.py profiles [scans/ ...] [--sheets 4] [--out profile_latency.json]
+
+`profiles` writes seconds per OCR page for each extraction profile to the file
+resume_extractor reads (PROFILE_LATENCY_PATH), which /extract-profiles reports and
+estimate_cost scales by. Run it on the deployment hardware.
+"""
+import argparse, json, os, sys, tempfile, time
+from typing import List
+
+import numpy as np
+import pdfplumber
+from PIL import Image, ImageDraw
+
+import resume_extractor as rx
+
+def _collect(paths: List[str], exts=(".pdf",)) -> List[str]:
+    out = []
+    for p in paths:
+        if os.path.isdir(p):
+            for root, _, files in os.walk(p):
+                out += [os.path.join(root, f) for f in sorted(files) if f.lower().endswith(exts)]
+        else:
+            out.append(p)
+    return out
+
+def _table(rows: List[List], header: List[str]) -> None:
+    rows = [header] + [[str(c) for c in r] for r in rows]
+    widths = [max(len(r[i]) for r in rows) for i in range(len(header))]
+    for r in rows:
+        print("  ".join(c.ljust(w) for c, w in zip(r, widths)))
+
+def bench_text_backends(files: List[str], repeat: int) -> None:
+    rows = []
+    for name in rx.PDF_TEXT_BACKENDS:
+        if name == "pdfium" and rx.pdfium is None:
+            print("pypdfium2 not installed; skipping pdfium", file=sys.stderr)
+            continue
+        best = float("inf")
+        pages = chars = 0
+        for _ in range(repeat):
+            pages = chars = 0
+            t0 = time.perf_counter()
+            for path in files:
+                with pdfplumber.open(path) as pdf:
+                    backend = rx.PDF_TEXT_BACKENDS[name](path, pdf)
+                    try:
+                        for i in range(len(pdf.pages)):
+                            chars += len(rx._safe_page_text(backend, i) or "")
+                            pages += 1
+                    finally:
+                        backend.close()
+            best = min(best, time.perf_counter() - t0)
+        rows.append([name, len(files), pages, chars, f"{best:.3f}", f"{1000 * best / max(pages, 1):.1f}"])
+    _table(rows, ["backend", "files", "pages", "chars", "best_s", "ms/page"])
+
+def _duplex_scan(path: str, sheets: int) -> None:
+    """A scanned bundle where every other page is the (near-)blank back of a sheet."""
+    rng = np.random.default_rng(0)
+    pages = []
+    for i in range(sheets):
+        front = Image.new("L", (1275, 1650), 255)
+        draw = ImageDraw.Draw(front)
+        for line in range(40):
+            draw.text((110, 120 + line * 34), f"Sheet {i + 1} line {line}: project experience, tools and results", fill=0)
+        back = np.clip(rng.normal(246, 3, (1650, 1275)), 0, 255).astype(np.uint8)  # paper grain
+        back[:, :12] = 90  # scanner edge shadow, inside the ignored margin
+        pages += [front, Image.fromarray(back)]
+    pages[0].save(path, "PDF", save_all=True, append_images=pages[1:], resolution=150.0)
+
+def bench_blank_pages(sheets: int) -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "duplex.pdf")
+        _duplex_scan(path, sheets)
+        rows = []
+        for skip in (False, True):
+            t0 = time.perf_counter()
+            _, meta, _ = rx.extract_pdf(path, "eng", skip_blank=skip)
+            rows.append([skip, meta["page_count"], meta["used_ocr_pages"], meta["blank_pages_skipped"],
+                         f"{time.perf_counter() - t0:.2f}"])
+    _table(rows, ["skip_blank", "pages", "ocr_pages", "skipped", "seconds"])
+
+def bench_profiles(files: List[str], sheets: int, out_path: str) -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        if not files:
+            files = [os.path.join(tmp, "scan.pdf")]
+            _duplex_scan(files[0], sheets)
+        rows, measured = [], {}
+        for name in rx.PROFILES:
+            ocr_s = pages = chars = 0
+            for path in files:
+                text, meta, _ = rx.extract_pdf(path, "eng", skip_blank=False, ocr_workers=0,
+                                               two_pass=False, profile=name)
+                ocr_s += meta["timings"]["ocr"]
+                pages += meta["used_ocr_pages"]
+                chars += len(text)
+            if not pages:
+                print(f"{name}: no page needed OCR; pass scanned PDFs", file=sys.stderr)
+                continue
+            measured[name] = {"ocr_page_seconds": round(ocr_s / pages, 3), "pages": pages,
+                              "measured_at": time.strftime("%Y-%m-%dT%H:%M:%S")}
+            rows.append([name, pages, chars, f"{ocr_s:.2f}", measured[name]["ocr_page_seconds"]])
+    _table(rows, ["profile", "ocr_pages", "chars", "ocr_s", "s/page"])
+    if measured:
+        with open(out_path, "w") as fh:
+            json.dump(measured, fh, indent=2)
+        print(f"wrote {out_path}")
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    tb = sub.add_parser("text-backends", help="compare PDF text-layer backends on the same corpus")
+    tb.add_argument("paths", nargs="+")
+    tb.add_argument("--repeat", type=int, default=3)
+    bp = sub.add_parser("blank-pages", help="OCR time on a synthetic duplex scan with and without blank skipping")
+    bp.add_argument("--sheets", type=int, default=10)
+    pp = sub.add_parser("profiles", help="seconds per OCR page of each extraction profile")
+    pp.add_argument("paths", nargs="*", help="scanned PDFs; a synthetic scan when omitted")
+    pp.add_argument("--sheets", type=int, default=4, help="sheets in the synthetic scan")
+    pp.add_argument("--out", default=rx.PROFILE_LATENCY_PATH)
+    args = ap.parse_args()
+
+    if args.cmd == "text-backends":
+        bench_text_backends(_collect(args.paths), args.repeat)
+    elif args.cmd == "blank-pages":
+        bench_blank_pages(args.sheets)
+    elif args.cmd == "profiles":
+        bench_profiles(_collect(args.paths), args.sheets, args.out)
+
+if __name__ == "__main__":
+    main()
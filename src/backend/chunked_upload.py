@@ -0,0 +1,180 @@
+"""Resumable chunked uploads spooled straight to disk.
+
+    POST /uploads?filename=cv.pdf&size=N   -> {"upload_id", "offset": 0}
+    PUT  /uploads/<id>  Content-Range: bytes <start>-<end>/<size>, raw body
+         -> {"upload_id", "offset"}; the final chunk returns the extraction result
+    GET  /uploads/<id>                      -> {"upload_id", "offset", "size"}
+
+Chunk bodies are read from the raw request stream and written to a spool file,
+updating the SHA-256 in the same pass, so the completed file is rarely re-read. A
+client that loses its connection asks for the offset and resumes from there.
+
+Any worker process may take the next chunk, so the spool file is the only state
+trusted: the offset is its size, read under an exclusive flock on every write, and
+a chunk is written at its own start rather than appended. A process keeps a running
+hash only for as many bytes as it has seen; after another process wrote, the hash
+is rebuilt from disk. Spool and metadata files are 0600 in a private_dir.
+"""
+import hashlib, json, os, re, tempfile, threading, time, uuid
+from typing import Any, Dict, IO, Optional, Tuple
+
+try:
+    import fcntl
+except Exception:  # Windows: coordinate threads of this process only
+    fcntl = None
+
+from private_dir import UnsafeDirectory, private_dir
+
+UPLOAD_SPOOL_DIR = os.getenv("UPLOAD_SPOOL_DIR", os.path.join(tempfile.gettempdir(), "inqous_uploads"))
+UPLOAD_TTL = float(os.getenv("UPLOAD_TTL", str(24 * 3600)))
+
+_ID_RE = re.compile(r"^[0-9a-f]{32}$")
+_RANGE_RE = re.compile(r"^bytes (\d+)-(\d+)/(\d+|\*)$")
+
+# upload_id -> (bytes hashed, running sha256) for chunks this process wrote
+_hashes: Dict[str, Tuple[int, Any]] = {}
+_locks: Dict[str, threading.Lock] = {}
+_sessions_lock = threading.Lock()
+
+class OffsetMismatch(Exception):
+    def __init__(self, offset: int):
+        super().__init__(f"Expected chunk at offset {offset}")
+        self.offset = offset
+
+def _private_open(path: str, mode: str, flags: int):
+    return os.fdopen(os.open(path, flags | os.O_CREAT, 0o600), mode)
+
+def parse_content_range(header: Optional[str]):
+    """Returns (start, size or None); a missing header means a single chunk from 0."""
+    if not header:
+        return 0, None
+    m = _RANGE_RE.match(header.strip())
+    if not m:
+        raise ValueError(f"Bad Content-Range: {header}")
+    return int(m.group(1)), None if m.group(3) == "*" else int(m.group(3))
+
+class UploadSession:
+    def __init__(self, upload_id: str, filename: str, size: Optional[int], options: Dict[str, Any]):
+        self.upload_id = upload_id
+        self.filename = filename
+        self.size = size
+        self.options = options
+        suffix = os.path.splitext(filename)[1].lower()
+        self.path = os.path.join(UPLOAD_SPOOL_DIR, upload_id + suffix)
+        self._meta_path = os.path.join(UPLOAD_SPOOL_DIR, upload_id + ".json")
+
+    @classmethod
+    def create(cls, filename: str, size: Optional[int], options: Dict[str, Any]) -> "UploadSession":
+        private_dir(UPLOAD_SPOOL_DIR)  # UnsafeDirectory: no uploads through someone else's directory
+        _sweep()
+        sess = cls(uuid.uuid4().hex, filename, size, options)
+        _private_open(sess.path, "wb", os.O_WRONLY | os.O_EXCL).close()
+        sess._save_meta()
+        return sess
+
+    @classmethod
+    def load(cls, upload_id: str) -> Optional["UploadSession"]:
+        if not _ID_RE.match(upload_id):
+            return None
+        try:
+            private_dir(UPLOAD_SPOOL_DIR)
+        except OSError:
+            return None
+        # always from disk: the size may have been set by a chunk another process took
+        try:
+            with open(os.path.join(UPLOAD_SPOOL_DIR, upload_id + ".json")) as fh:
+                m = json.load(fh)
+        except (OSError, ValueError):
+            return None
+        sess = cls(upload_id, m["filename"], m["size"], m["options"])
+        return sess if os.path.exists(sess.path) else None
+
+    def _save_meta(self) -> None:
+        with _private_open(self._meta_path, "w", os.O_WRONLY | os.O_TRUNC) as fh:
+            json.dump({"filename": self.filename, "size": self.size, "options": self.options}, fh)
+
+    @property
+    def offset(self) -> int:
+        try:
+            return os.path.getsize(self.path)
+        except OSError:
+            return 0
+
+    @property
+    def complete(self) -> bool:
+        return self.size is not None and self.offset >= self.size
+
+    def _running_hash(self, fh: IO[bytes], length: int):
+        """The sha256 of the first length bytes: this process's own if it covers exactly
+        that prefix, else rebuilt from the file."""
+        with _sessions_lock:
+            hashed, h = _hashes.pop(self.upload_id, (0, None))
+        if h is not None and hashed == length:
+            return h
+        h = hashlib.sha256()
+        fh.seek(0)
+        left = length
+        while left:
+            chunk = fh.read(min(left, 1 << 20))
+            if not chunk:
+                break
+            h.update(chunk)
+            left -= len(chunk)
+        return h
+
+    def digest(self) -> str:
+        with open(self.path, "rb") as fh:
+            return self._running_hash(fh, os.fstat(fh.fileno()).st_size).hexdigest()
+
+    def write(self, stream: IO[bytes], start: int, size: Optional[int] = None) -> int:
+        """Write a chunk read from stream at start, which must equal the spool size."""
+        with _sessions_lock:
+            lock = _locks.setdefault(self.upload_id, threading.Lock())
+        with lock, open(self.path, "r+b") as out:
+            if fcntl is not None:
+                fcntl.flock(out.fileno(), fcntl.LOCK_EX)  # released on close
+            offset = os.fstat(out.fileno()).st_size
+            if start != offset:
+                raise OffsetMismatch(offset)
+            if size is not None and size != self.size:
+                self.size = size
+                self._save_meta()
+            h = self._running_hash(out, start)
+            out.seek(start)
+            try:
+                for chunk in iter(lambda: stream.read(1 << 20), b""):
+                    out.write(chunk)
+                    h.update(chunk)
+                    offset += len(chunk)
+            finally:
+                out.flush()
+                with _sessions_lock:
+                    _hashes[self.upload_id] = (offset, h)
+            return offset
+
+    def status(self) -> Dict[str, Any]:
+        return {"upload_id": self.upload_id, "offset": self.offset, "size": self.size}
+
+    def discard(self) -> None:
+        with _sessions_lock:
+            _hashes.pop(self.upload_id, None)
+            _locks.pop(self.upload_id, None)
+        for p in (self.path, self._meta_path):
+            try:
+                os.remove(p)
+            except OSError:
+                pass
+
+def _sweep() -> None:
+    with _sessions_lock:
+        for upload_id in [u for u in _hashes if not os.path.exists(os.path.join(UPLOAD_SPOOL_DIR, u + ".json"))]:
+            _hashes.pop(upload_id, None)
+            _locks.pop(upload_id, None)
+    now = time.time()
+    for name in os.listdir(UPLOAD_SPOOL_DIR):
+        path = os.path.join(UPLOAD_SPOOL_DIR, name)
+        try:
+            if now - os.path.getmtime(path) > UPLOAD_TTL:
+                os.remove(path)
+        except OSError:
+            pass
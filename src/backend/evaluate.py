@@ -0,0 +1,344 @@
+"""Accuracy versus latency of extractor configurations on a generated golden corpus.
+
+    python evaluate.py                                  # all configs, compare to the baseline
+    python evaluate.py --configs fast,balanced --per-doc
+    python evaluate.py --update-baseline                # accept the current numbers
+
+The corpus (a text-layer PDF, clean/noisy/skewed scans, repeated headers and
+footers, a two-column page, a low-contrast PNG, a phone-quality JPEG and a DOCX) is
+rendered from seeded text, so the ground truth is exact; it is built under --corpus
+on first use. Every configuration runs in a fresh process over the whole corpus and
+is scored by character and word error rate (Levenshtein distance over the reference
+length, whitespace-normalised), wall time and peak RSS including tesseract
+children. The table marks the Pareto-optimal configurations.
+
+With a baseline (--baseline, default evaluate_baseline.json here) the exit status
+is 1 when a configuration got less accurate without getting faster, i.e. CER or WER
+rose by more than the tolerance while its time stayed within --time-tol of the
+baseline or above it. Baselines are hardware specific; record them where they run.
+"""
+import argparse, json, os, random, sys, tempfile, time
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+from PIL import Image, ImageDraw, ImageFilter, ImageFont
+
+from synthetic_docs import random_lines, text_pdf
+
+try:
+    import resource
+except Exception:  # Windows: no getrusage, peak RSS is not reported
+    resource = None
+
+CORPUS_VERSION = 2
+DEFAULT_CORPUS = os.path.join(tempfile.gettempdir(), "inqous_golden")
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "evaluate_baseline.json")
+
+# name -> extract_any options, plus environment for switches that are module settings
+CONFIGS: Dict[str, Dict[str, Any]] = {
+    "fast": {"opts": {"profile": "fast"}},
+    "fast+two-pass": {"opts": {"profile": "fast", "two_pass": True}},
+    "balanced": {"opts": {"profile": "balanced"}},
+    "balanced+two-pass": {"opts": {"profile": "balanced", "two_pass": True}},
+    "balanced+fixed-psm": {"opts": {"profile": "balanced"}, "env": {"OCR_AUTO_PSM": "0"}},
+    "balanced+no-band-mask": {"opts": {"profile": "balanced"}, "env": {"MASK_REPEATED_BANDS": "0"}},
+    "balanced+4-workers": {"opts": {"profile": "balanced", "ocr_workers": 4}},
+    "accurate": {"opts": {"profile": "accurate"}},
+}
+
+# -------------- golden corpus --------------
+
+def _font(px: int) -> ImageFont.FreeTypeFont:
+    try:
+        return ImageFont.load_default(px)
+    except (TypeError, OSError):  # Pillow < 10.1 or built without FreeType
+        return ImageFont.truetype("DejaVuSans.ttf", px)
+
+def _fit(lines: List[str], dpi: int, columns: int) -> List[str]:
+    """Cut lines to fit their column with a clear gutter, whatever font _font found."""
+    font = _font(int(11 * dpi / 72))
+    width = 0.9 * (int(8.5 * dpi) - 2 * dpi) / columns
+    out = []
+    for line in lines:
+        while font.getlength(line) > width:
+            line = line[:-1]
+        out.append(line.rstrip())
+    return out
+
+def _page_image(columns: List[List[str]], dpi: int, ink: int = 0, paper: int = 255,
+                header: Optional[str] = None, footer: Optional[str] = None) -> Image.Image:
+    w, h = int(8.5 * dpi), int(11 * dpi)
+    img = Image.new("L", (w, h), paper)
+    draw = ImageDraw.Draw(img)
+    font = _font(int(11 * dpi / 72))
+    step = int(16 * dpi / 72)
+    margin = dpi
+    col_w = (w - 2 * margin) // len(columns)
+    for c, lines in enumerate(columns):
+        for i, line in enumerate(lines):
+            draw.text((margin + c * col_w, int(1.3 * dpi) + i * step), line, fill=ink, font=font)
+    if header:
+        draw.text((margin, dpi // 2), header, fill=ink, font=font)
+    if footer:
+        draw.text((margin, h - int(0.7 * dpi)), footer, fill=ink, font=font)
+    return img
+
+def _degrade(img: Image.Image, rng: np.random.Generator, noise: float = 0.0, skew: float = 0.0,
+             blur: float = 0.0) -> Image.Image:
+    if skew:
+        img = img.rotate(skew, resample=Image.BICUBIC, expand=False, fillcolor=255)
+    if blur:
+        img = img.filter(ImageFilter.GaussianBlur(blur))
+    if noise:
+        arr = np.asarray(img, dtype=np.float32) + rng.normal(0, noise, (img.height, img.width))
+        img = Image.fromarray(np.clip(arr, 0, 255).astype(np.uint8))
+    return img
+
+def _save_pdf(path: str, images: List[Image.Image], dpi: int) -> None:
+    images[0].save(path, "PDF", save_all=True, append_images=images[1:], resolution=float(dpi))
+
+def build_corpus(corpus: str) -> Dict[str, str]:
+    """Render the golden documents into corpus/ and return {file name: reference text}."""
+    os.makedirs(corpus, exist_ok=True)
+    rng = random.Random(CORPUS_VERSION)
+    nrng = np.random.default_rng(CORPUS_VERSION)
+    truth: Dict[str, str] = {}
+
+    pages = [random_lines(rng, 30), random_lines(rng, 30)]
+    text_pdf(os.path.join(corpus, "text_layer.pdf"), pages)
+    truth["text_layer.pdf"] = "\n".join(sum(pages, []))
+
+    pages = [random_lines(rng, 30), random_lines(rng, 25)]
+    _save_pdf(os.path.join(corpus, "scan_clean.pdf"), [_page_image([p], 300) for p in pages], 300)
+    truth["scan_clean.pdf"] = "\n".join(sum(pages, []))
+
+    page = random_lines(rng, 30)
+    _save_pdf(os.path.join(corpus, "scan_noisy_skewed.pdf"),
+              [_degrade(_page_image([page], 200), nrng, noise=20, skew=0.8)], 200)
+    truth["scan_noisy_skewed.pdf"] = "\n".join(page)
+
+    # running header/footer on every page: the expected output is the body alone
+    pages = [random_lines(rng, 28) for _ in range(3)]
+    _save_pdf(os.path.join(corpus, "scan_headers.pdf"),
+              [_page_image([p], 300, header="Jordan Avery - Curriculum Vitae - confidential",
+                           footer="jordan.avery@example.com | +44 20 7946 0000") for p in pages], 300)
+    truth["scan_headers.pdf"] = "\n".join(sum(pages, []))
+
+    left, right = random_lines(rng, 26), random_lines(rng, 26)
+    left, right = _fit(left, 300, 2), _fit(right, 300, 2)
+    _page_image([left, right], 300).save(os.path.join(corpus, "two_column.png"))
+    truth["two_column.png"] = "\n".join(left + right)
+    _check_columns(os.path.join(corpus, "two_column.png"))
+
+    page = random_lines(rng, 30)
+    _page_image([page], 300, ink=120, paper=200).save(os.path.join(corpus, "low_contrast.png"))
+    truth["low_contrast.png"] = "\n".join(page)
+
+    page = random_lines(rng, 30)
+    _degrade(_page_image([page], 200), nrng, noise=8, skew=-1.5, blur=0.8).convert("RGB").save(
+        os.path.join(corpus, "phone.jpg"), quality=35)
+    truth["phone.jpg"] = "\n".join(page)
+
+    from docx import Document
+    doc = Document()
+    paras = random_lines(rng, 40)
+    for p in paras:
+        doc.add_paragraph(p)
+    doc.save(os.path.join(corpus, "resume.docx"))
+    truth["resume.docx"] = "\n".join(paras)
+
+    with open(os.path.join(corpus, "truth.json"), "w") as fh:
+        json.dump({"version": CORPUS_VERSION, "documents": truth}, fh, indent=2)
+    return truth
+
+def _check_columns(path: str) -> None:
+    """The two-column page only measures the column split if the classifier finds it."""
+    import cv2
+    import resume_extractor as rx
+    p = rx.PROFILES["balanced"]
+    proc = rx._preprocess_bgr_for_ocr(cv2.imread(path), profile=p)
+    mode = rx._choose_layout(proc, rx._proc_dpi(p))["mode"]
+    if mode != "columns":
+        raise RuntimeError(f"{os.path.basename(path)} classifies as {mode}, not columns")
+
+def load_corpus(corpus: str, rebuild: bool = False) -> Dict[str, str]:
+    try:
+        with open(os.path.join(corpus, "truth.json")) as fh:
+            data = json.load(fh)
+        if not rebuild and data.get("version") == CORPUS_VERSION:
+            return data["documents"]
+    except (OSError, ValueError):
+        pass
+    return build_corpus(corpus)
+
+# -------------- scoring --------------
+
+def levenshtein(a: Sequence, b: Sequence) -> int:
+    """Edit distance between two sequences (characters or words), one numpy row per
+    item of the shorter one."""
+    if len(a) < len(b):
+        a, b = b, a
+    if not b:
+        return len(a)
+    ids: Dict[Any, int] = {}
+    av = np.array([ids.setdefault(x, len(ids)) for x in a])
+    bv = [ids.setdefault(x, len(ids)) for x in b]
+    idx = np.arange(len(av) + 1)
+    prev = idx.copy()
+    for i, x in enumerate(bv, 1):
+        cur = np.empty_like(prev)
+        cur[0] = i
+        np.minimum(prev[1:] + 1, prev[:-1] + (av != x), out=cur[1:])
+        # insertions: cur[j] = min(cur[j], cur[j-1] + 1) as one running minimum
+        prev = np.minimum.accumulate(cur - idx) + idx
+    return int(prev[-1])
+
+def _normalise(text: str) -> str:
+    return " ".join(text.split())
+
+def score(hyp: str, ref: str) -> Dict[str, int]:
+    hyp, ref = _normalise(hyp), _normalise(ref)
+    return {"char_errors": levenshtein(hyp, ref), "chars": len(ref),
+            "word_errors": levenshtein(hyp.split(), ref.split()), "words": len(ref.split())}
+
+# -------------- runs --------------
+
+def _init_worker(env: Dict[str, str]) -> None:
+    os.environ.update(env)
+
+def _peak_mb() -> Optional[float]:
+    if resource is None:
+        return None
+    kb = 2**20 if sys.platform == "darwin" else 2**10
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / kb
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / kb
+    return round(max(own, children), 1)
+
+def _run_config(corpus: str, truth: Dict[str, str], opts: Dict[str, Any], repeat: int) -> Dict[str, Any]:
+    import resume_extractor as rx  # after _init_worker, so module settings see the config's env
+
+    docs = {}
+    for name, ref in truth.items():
+        best, text, error = float("inf"), "", None
+        for _ in range(repeat):
+            t0 = time.perf_counter()
+            try:
+                res = rx.extract_any(os.path.join(corpus, name), **opts)
+                text = res["text"]
+                # per-page OCR failures come back as warnings; they must not pass as plain misreads
+                error = next((w for w in res["warnings"] if w.startswith("OCR failed")), None)
+            except Exception as e:
+                text, error = "", f"{type(e).__name__}: {e}"
+            best = min(best, time.perf_counter() - t0)
+        docs[name] = {"seconds": round(best, 3), **score(text, ref), **({"error": error} if error else {})}
+    return {"docs": docs, "peak_mb": _peak_mb()}
+
+def evaluate(corpus: str, truth: Dict[str, str], names: List[str], repeat: int = 1) -> Dict[str, Dict[str, Any]]:
+    results = {}
+    ctx = mp.get_context("spawn")
+    for name in names:
+        cfg = CONFIGS[name]
+        # a fresh interpreter per config: clean peak RSS, and env switches read at import
+        env = {"STAGE_TIMINGS_PATH": "", **cfg.get("env", {})}  # keep host calibration out of it
+        opts = {"ocr_workers": 0, "skip_blank": False, **cfg["opts"]}
+        print(f"running {name} ...", file=sys.stderr)
+        with ProcessPoolExecutor(max_workers=1, mp_context=ctx, initializer=_init_worker, initargs=(env,)) as pool:
+            run = pool.submit(_run_config, corpus, truth, opts, repeat).result()
+        docs = run["docs"].values()
+        chars, words = sum(d["chars"] for d in docs), sum(d["words"] for d in docs)
+        results[name] = {"cer": round(sum(d["char_errors"] for d in docs) / max(chars, 1), 4),
+                         "wer": round(sum(d["word_errors"] for d in docs) / max(words, 1), 4),
+                         "seconds": round(sum(d["seconds"] for d in docs), 3),
+                         "peak_mb": run["peak_mb"], "errors": sum("error" in d for d in docs),
+                         "docs": run["docs"]}
+    return results
+
+def pareto(results: Dict[str, Dict[str, Any]]) -> List[str]:
+    """Configs no other config beats on both CER and time."""
+    def dominated(a, b):
+        return b["cer"] <= a["cer"] and b["seconds"] <= a["seconds"] and (b["cer"], b["seconds"]) != (a["cer"], a["seconds"])
+    return [n for n, r in results.items() if not any(dominated(r, o) for m, o in results.items() if m != n)]
+
+def regressions(results: Dict[str, Dict[str, Any]], baseline: Dict[str, Dict[str, Any]],
+                cer_tol: float, wer_tol: float, time_tol: float) -> List[str]:
+    out = []
+    for name, r in results.items():
+        base = baseline.get(name)
+        if base is None:
+            continue
+        worse = r["cer"] > base["cer"] + cer_tol or r["wer"] > base["wer"] + wer_tol
+        if worse and r["seconds"] >= base["seconds"] * (1 - time_tol):
+            out.append(f"{name}: CER {base['cer']:.2%} -> {r['cer']:.2%}, WER {base['wer']:.2%} -> {r['wer']:.2%}"
+                       f" at {base['seconds']:.2f}s -> {r['seconds']:.2f}s")
+    return out
+
+def _table(rows: List[List], header: List[str]) -> None:
+    rows = [header] + [[str(c) for c in r] for r in rows]
+    widths = [max(len(r[i]) for r in rows) for i in range(len(header))]
+    for r in rows:
+        print("  ".join(c.ljust(w) for c, w in zip(r, widths)))
+
+def _print(results: Dict[str, Dict[str, Any]], baseline: Dict[str, Dict[str, Any]], per_doc: bool) -> None:
+    front = set(pareto(results))
+    rows = []
+    for name, r in sorted(results.items(), key=lambda kv: kv[1]["seconds"]):
+        base = baseline.get(name)
+        delta = f"{r['cer'] - base['cer']:+.2%} / {r['seconds'] - base['seconds']:+.2f}s" if base else ""
+        rows.append([name, f"{r['cer']:.2%}", f"{r['wer']:.2%}", f"{r['seconds']:.2f}", r["peak_mb"],
+                     r["errors"] or "", "*" if name in front else "", delta])
+    _table(rows, ["config", "cer", "wer", "seconds", "peak_mb", "errors", "pareto", "vs baseline (cer/time)"])
+    if per_doc:
+        for name, r in results.items():
+            print(f"\n{name}")
+            _table([[doc, f"{d['char_errors'] / max(d['chars'], 1):.2%}", f"{d['word_errors'] / max(d['words'], 1):.2%}",
+                     f"{d['seconds']:.2f}", d.get("error", "")] for doc, d in r["docs"].items()],
+                   ["document", "cer", "wer", "seconds", "error"])
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--corpus", default=DEFAULT_CORPUS, help="golden corpus directory (built if missing)")
+    ap.add_argument("--rebuild", action="store_true", help="regenerate the corpus")
+    ap.add_argument("--configs", help=f"comma separated subset of {', '.join(CONFIGS)}")
+    ap.add_argument("--repeat", type=int, default=1, help="runs per document; the fastest counts")
+    ap.add_argument("--baseline", default=DEFAULT_BASELINE)
+    ap.add_argument("--update-baseline", action="store_true", help="write these results as the new baseline")
+    ap.add_argument("--cer-tol", type=float, default=0.002)
+    ap.add_argument("--wer-tol", type=float, default=0.005)
+    ap.add_argument("--time-tol", type=float, default=0.1,
+                    help="a config must be this fraction faster than baseline to excuse lost accuracy")
+    ap.add_argument("--per-doc", action="store_true")
+    ap.add_argument("--json", help="also write the full results to this file")
+    args = ap.parse_args()
+
+    names = args.configs.split(",") if args.configs else list(CONFIGS)
+    unknown = [n for n in names if n not in CONFIGS]
+    if unknown:
+        ap.error(f"unknown config(s): {', '.join(unknown)}")
+
+    truth = load_corpus(args.corpus, args.rebuild)
+    results = evaluate(args.corpus, truth, names, max(1, args.repeat))
+    try:
+        with open(args.baseline) as fh:
+            baseline = json.load(fh)["configs"]
+    except (OSError, ValueError, KeyError):
+        baseline = {}
+    _print(results, baseline, args.per_doc)
+    if args.json:
+        with open(args.json, "w") as fh:
+            json.dump(results, fh, indent=2)
+
+    if args.update_baseline:
+        baseline.update({n: {k: r[k] for k in ("cer", "wer", "seconds", "peak_mb")} for n, r in results.items()})
+        with open(args.baseline, "w") as fh:
+            json.dump({"corpus_version": CORPUS_VERSION, "configs": baseline}, fh, indent=2)
+        print(f"wrote {args.baseline}")
+        return
+    failed = regressions(results, baseline, args.cer_tol, args.wer_tol, args.time_tol)
+    for line in failed:
+        print("REGRESSION", line, file=sys.stderr)
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,227 @@
+"""Bulk extraction of a local archive to JSONL.
+
+    python ingest.py archive/ more.pdf --out results.jsonl [--workers 8]
+    python ingest.py --manifest files.txt --out results.jsonl --lang auto --structured
+
+Every input file becomes one JSON line {"path", "sha256", "status", "seconds", ...}
+with the extract_any result ("text", "meta", "warnings") or an "error". Lines are
+flushed as soon as a file finishes, so after a crash the same command resumes:
+paths already present in the output are skipped (failed ones too, unless
+--retry-errors). Progress, throughput and ETA go to stderr.
+
+Directories are walked for files with a supported extension or, whatever their name,
+content that extract_any recognises by its signature (a scan saved as .tmp, a PDF
+without an extension). --all-files takes every regular file instead.
+
+A file that runs past --timeout, or whose worker dies (segfault, OOM kill), is
+recorded as failed and the pool is replaced, so a resume never trips over it again.
+A dying worker fails every file in flight with it; those are re-run one at a time
+to find the one responsible.
+"""
+import argparse, json, os, sys, time
+import multiprocessing as mp
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, TimeoutError, wait
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Dict, Iterator, List, Set
+
+import resume_extractor as rx
+
+def _wanted(path: str) -> bool:
+    if os.path.splitext(path)[1].lower() in rx.SUPPORTED:
+        return True
+    # dispatch sniffs content, so a misnamed document is still one; any UTF-8 file
+    # would sniff as txt, so that alone does not count
+    return rx._sniff_type(path) not in (None, "txt")
+
+def _walk(paths: List[str], all_files: bool = False) -> Iterator[str]:
+    for p in paths:
+        if os.path.isdir(p):
+            for root, dirs, files in os.walk(p):
+                dirs.sort()
+                for f in sorted(files):
+                    path = os.path.join(root, f)
+                    if os.path.isfile(path) and (all_files or _wanted(path)):
+                        yield path
+        else:
+            yield p
+
+def _manifest(path: str) -> Iterator[str]:
+    with open(path) as fh:
+        for line in fh:
+            line = line.strip()
+            if line and not line.startswith("#"):
+                yield line
+
+def _done(out_path: str, retry_errors: bool) -> Set[str]:
+    """Paths already recorded in out_path; a torn last line from a crash is ignored."""
+    done: Set[str] = set()
+    try:
+        with open(out_path) as fh:
+            for line in fh:
+                try:
+                    row = json.loads(line)
+                except ValueError:
+                    continue
+                if row.get("status") == "ok" or not retry_errors:
+                    done.add(row["path"])
+    except OSError:
+        pass
+    return done
+
+def _extract_one(path: str, opts: Dict[str, Any]) -> Dict[str, Any]:
+    t0 = time.perf_counter()
+    row: Dict[str, Any] = {"path": path}
+    try:
+        row["sha256"] = rx._file_digest(path)
+        res = rx.extract_any(path, doc_hash=row["sha256"], **opts)
+        row.update(status="ok", **res)
+    except Exception as e:
+        row.update(status="error", error=f"{type(e).__name__}: {e}")
+    row["seconds"] = round(time.perf_counter() - t0, 3)
+    return row
+
+def _failed_row(path: str, error: str, seconds: float) -> Dict[str, Any]:
+    return {"path": path, "status": "error", "error": error, "seconds": round(seconds, 3)}
+
+def _stop(pool: ProcessPoolExecutor) -> None:
+    """Shut a pool down without waiting for a hung worker to finish its file."""
+    for proc in list((getattr(pool, "_processes", None) or {}).values()):
+        proc.kill()
+    pool.shutdown(wait=False, cancel_futures=True)
+
+def _progress(done: int, total: int, failed: int, t0: float) -> None:
+    elapsed = time.monotonic() - t0
+    rate = done / elapsed if elapsed > 0 else 0.0
+    eta = (total - done) / rate if rate > 0 else 0.0
+    sys.stderr.write(f"\r{done}/{total} files  {failed} failed  {rate:.2f} files/s  "
+                     f"ETA {int(eta // 3600)}:{int(eta % 3600 // 60):02d}:{int(eta % 60):02d}  ")
+    sys.stderr.flush()
+
+def ingest(files: List[str], out_path: str, workers: int, opts: Dict[str, Any],
+           retry_errors: bool = False, timeout: float = 600.0) -> int:
+    """Returns the number of files that failed in this run."""
+    done = _done(out_path, retry_errors)
+    todo = [f for f in dict.fromkeys(files) if f not in done]
+    if done:
+        print(f"resuming: {len(done)} already recorded, {len(todo)} to go", file=sys.stderr)
+    if not todo:
+        return 0
+
+    # each file already has a process of its own; a per-page OCR pool would oversubscribe
+    opts = {"ocr_workers": 0, **opts}
+    methods = mp.get_all_start_methods()
+    ctx = mp.get_context("forkserver" if "forkserver" in methods else "spawn")
+    if "forkserver" in methods:
+        ctx.set_forkserver_preload(["resume_extractor"])
+
+    with open(out_path, "a+", encoding="utf-8") as out:
+        out.seek(0, os.SEEK_END)
+        if out.tell():
+            out.seek(out.tell() - 1)
+            if out.read(1) != "\n":
+                out.write("\n")  # terminate a line torn by the previous crash
+
+        finished = failed = 0
+        t0 = last = time.monotonic()
+        pending = iter(todo)
+        requeued: List[str] = []
+        inflight: Dict[Any, str] = {}
+        started: Dict[Any, float] = {}
+        pool = ProcessPoolExecutor(max_workers=workers, mp_context=ctx)
+
+        def record(row: Dict[str, Any]) -> None:
+            nonlocal finished, failed
+            out.write(json.dumps(row, ensure_ascii=False) + "\n")
+            finished += 1
+            failed += row["status"] != "ok"
+
+        def fill() -> None:
+            # bounded submission keeps memory flat on archives of any size
+            while len(inflight) < workers * 2:
+                path = requeued.pop() if requeued else next(pending, None)
+                if path is None:
+                    return
+                inflight[pool.submit(_extract_one, path, opts)] = path
+
+        def alone(path: str) -> Dict[str, Any]:
+            """Run one file on a pool of its own, with nothing else in flight."""
+            solo = ProcessPoolExecutor(max_workers=1, mp_context=ctx)
+            t = time.monotonic()
+            try:
+                return solo.submit(_extract_one, path, opts).result(timeout=timeout)
+            except TimeoutError:
+                return _failed_row(path, f"timed out after {timeout:.0f}s", time.monotonic() - t)
+            except BrokenProcessPool:
+                return _failed_row(path, "extraction process died", time.monotonic() - t)
+            finally:
+                _stop(solo)
+
+        try:
+            fill()
+            while inflight:
+                ready, _ = wait(list(inflight), timeout=1.0, return_when=FIRST_COMPLETED)
+                now = time.monotonic()
+                broken: List[str] = []
+                for fut in ready:
+                    path = inflight.pop(fut)
+                    started.pop(fut, None)
+                    try:
+                        record(fut.result(timeout=0))
+                    except BrokenProcessPool:
+                        broken.append(path)
+                for fut in inflight:
+                    if fut.running():
+                        started.setdefault(fut, now)  # queued files do not use up their time
+                hung = [f for f, at in started.items() if now - at > timeout]
+                if broken or hung:
+                    _stop(pool)
+                    for fut in hung:
+                        record(_failed_row(inflight.pop(fut), f"timed out after {timeout:.0f}s",
+                                           now - started[fut]))
+                    if broken:
+                        # every future of a dead pool fails with it; any of them may be the cause
+                        for path in broken + list(inflight.values()):
+                            record(alone(path))
+                            out.flush()
+                    else:
+                        requeued.extend(inflight.values())  # only killed along with the hung worker
+                    inflight.clear()
+                    started.clear()
+                    pool = ProcessPoolExecutor(max_workers=workers, mp_context=ctx)
+                fill()
+                if ready or hung:
+                    out.flush()
+                if now - last >= 1.0 or not inflight:
+                    _progress(finished, len(todo), failed, t0)
+                    last = now
+        finally:
+            _stop(pool)
+        sys.stderr.write("\n")
+    return failed
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("paths", nargs="*", help="files or directories to walk")
+    ap.add_argument("--manifest", help="text file with one input path per line")
+    ap.add_argument("--out", required=True, help="JSONL output, appended to and used for resume")
+    ap.add_argument("--workers", type=int, default=os.cpu_count() or 2)
+    ap.add_argument("--lang", default="eng")
+    ap.add_argument("--text-backend")
+    ap.add_argument("--structured", action="store_true")
+    ap.add_argument("--retry-errors", action="store_true", help="re-run files recorded as failed")
+    ap.add_argument("--all-files", action="store_true",
+                    help="walk every regular file, not only recognised documents")
+    ap.add_argument("--timeout", type=float, default=600.0, help="seconds one file may take (default 600)")
+    args = ap.parse_args()
+    if not args.paths and not args.manifest:
+        ap.error("give input paths or --manifest")
+
+    files = list(_walk(args.paths, args.all_files))
+    if args.manifest:
+        files += list(_manifest(args.manifest))
+    opts = {"lang": args.lang, "text_backend": args.text_backend, "structured": args.structured}
+    failed = ingest(files, args.out, max(1, args.workers), opts, args.retry_errors, args.timeout)
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,266 @@
+"""Durable extraction job queue in SQLite, shared by API nodes and worker processes.
+
+    POST /extract-jobs (multipart "file", same query options as /upload) -> 202 {"job_id"}
+    GET  /extract-jobs/<id>   -> {"job_id", "status", "attempts", ...} (+ "result" when done)
+
+    python jobqueue.py worker [--processes 4]     # pull and run jobs until stopped
+    python jobqueue.py status <job_id>
+
+A worker claims a job inside BEGIN IMMEDIATE, so exactly one claimant wins, and holds
+it under a lease it renews by heartbeat while extract_any runs. A worker that dies
+stops heartbeating; once the lease (visibility timeout) expires the job becomes
+claimable again. Failed attempts are retried with exponential backoff through
+available_at until max_attempts, after which the job is marked failed.
+
+Uploaded files are copied into JOBQUEUE_SPOOL next to the database; both directories
+must be private_dirs of the service user and spooled files are 0600, as they hold
+candidates' documents. For workers on
+several hosts, both must live on shared storage with working POSIX locks, and
+JOBQUEUE_JOURNAL should be "delete" (WAL needs shared memory on one host).
+"""
+import argparse, json, os, shutil, socket, sqlite3, sys, tempfile, threading, time, uuid
+import multiprocessing as mp
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, Optional
+
+from private_dir import private_dir
+
+JOBQUEUE_DB = os.getenv("JOBQUEUE_DB", os.path.join(tempfile.gettempdir(), "inqous_jobs", "jobs.db"))
+JOBQUEUE_SPOOL = os.getenv("JOBQUEUE_SPOOL", os.path.join(os.path.dirname(JOBQUEUE_DB), "spool"))
+JOBQUEUE_JOURNAL = os.getenv("JOBQUEUE_JOURNAL", "wal")
+JOB_VISIBILITY = float(os.getenv("JOB_VISIBILITY", "120"))   # lease length, seconds
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+JOB_RETRY_BASE = float(os.getenv("JOB_RETRY_BASE", "5"))     # first retry delay; doubles per attempt
+JOB_RETENTION = float(os.getenv("JOB_RETENTION", str(7 * 86400)))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id            TEXT PRIMARY KEY,
+    status        TEXT NOT NULL,      -- queued | running | done | failed
+    path          TEXT NOT NULL,
+    options       TEXT NOT NULL,      -- JSON keyword arguments for extract_any
+    attempts      INTEGER NOT NULL DEFAULT 0,
+    max_attempts  INTEGER NOT NULL,
+    available_at  REAL NOT NULL,
+    lease_owner   TEXT,
+    lease_expires REAL,
+    result        TEXT,
+    error         TEXT,
+    created_at    REAL NOT NULL,
+    updated_at    REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_ready ON jobs (status, available_at);
+"""
+
+class JobQueue:
+    def __init__(self, db_path: str = JOBQUEUE_DB, spool_dir: str = JOBQUEUE_SPOOL,
+                 visibility: float = JOB_VISIBILITY):
+        self.db_path = db_path
+        self.spool_dir = spool_dir
+        self.visibility = visibility
+        for d in (os.path.dirname(os.path.abspath(db_path)), spool_dir):
+            private_dir(d)
+        with self._connect() as db:
+            db.execute(f"PRAGMA journal_mode={JOBQUEUE_JOURNAL}")
+            db.executescript(_SCHEMA)
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        # autocommit mode: single statements commit on their own, claim() opens its own transaction
+        db = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        db.row_factory = sqlite3.Row
+        try:
+            yield db
+        finally:
+            db.close()
+
+    def enqueue(self, src_path: str, options: Dict[str, Any], max_attempts: int = JOB_MAX_ATTEMPTS) -> str:
+        """Copy src_path into the spool and queue extract_any(path, **options)."""
+        job_id = uuid.uuid4().hex
+        path = os.path.join(self.spool_dir, job_id + os.path.splitext(src_path)[1].lower())
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        with open(src_path, "rb") as src, os.fdopen(fd, "wb") as dst:
+            shutil.copyfileobj(src, dst, 1 << 20)
+        now = time.time()
+        with self._connect() as db:
+            db.execute("INSERT INTO jobs (id, status, path, options, max_attempts, available_at, created_at, updated_at)"
+                       " VALUES (?, 'queued', ?, ?, ?, ?, ?, ?)",
+                       (job_id, path, json.dumps(options), max_attempts, now, now, now))
+        return job_id
+
+    def claim(self, owner: str) -> Optional[Dict[str, Any]]:
+        now = time.time()
+        with self._connect() as db:
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                # a job whose lease ran out on its final attempt has crashed its worker every time
+                db.execute("UPDATE jobs SET status = 'failed', error = 'worker lost (lease expired)',"
+                           " lease_owner = NULL, updated_at = ?"
+                           " WHERE status = 'running' AND lease_expires < ? AND attempts >= max_attempts",
+                           (now, now))
+                row = db.execute("SELECT * FROM jobs WHERE (status = 'queued' AND available_at <= ?)"
+                                 " OR (status = 'running' AND lease_expires < ?)"
+                                 " ORDER BY available_at LIMIT 1", (now, now)).fetchone()
+                if row is not None:
+                    db.execute("UPDATE jobs SET status = 'running', lease_owner = ?, lease_expires = ?,"
+                               " attempts = attempts + 1, updated_at = ? WHERE id = ?",
+                               (owner, now + self.visibility, now, row["id"]))
+                db.execute("COMMIT")
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+        if row is None:
+            return None
+        job = dict(row)
+        job["attempts"] += 1
+        job["options"] = json.loads(job["options"])
+        return job
+
+    def _owned_update(self, job_id: str, owner: str, sql: str, args: tuple) -> bool:
+        with self._connect() as db:
+            cur = db.execute(sql + " WHERE id = ? AND lease_owner = ? AND status = 'running'",
+                             args + (job_id, owner))
+            return cur.rowcount == 1
+
+    def heartbeat(self, job_id: str, owner: str) -> bool:
+        """Extend the lease; False means it was lost and another worker may own the job."""
+        now = time.time()
+        return self._owned_update(job_id, owner, "UPDATE jobs SET lease_expires = ?, updated_at = ?",
+                                  (now + self.visibility, now))
+
+    def complete(self, job_id: str, owner: str, result: Dict[str, Any]) -> bool:
+        return self._owned_update(job_id, owner, "UPDATE jobs SET status = 'done', result = ?, error = NULL,"
+                                  " lease_owner = NULL, lease_expires = NULL, updated_at = ?",
+                                  (json.dumps(result), time.time()))
+
+    def fail(self, job_id: str, owner: str, error: str, attempts: int, max_attempts: int) -> bool:
+        now = time.time()
+        if attempts >= max_attempts:
+            return self._owned_update(job_id, owner, "UPDATE jobs SET status = 'failed', error = ?,"
+                                      " lease_owner = NULL, lease_expires = NULL, updated_at = ?", (error, now))
+        retry_at = now + JOB_RETRY_BASE * 2 ** (attempts - 1)
+        return self._owned_update(job_id, owner, "UPDATE jobs SET status = 'queued', error = ?, available_at = ?,"
+                                  " lease_owner = NULL, lease_expires = NULL, updated_at = ?", (error, retry_at, now))
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._connect() as db:
+            row = db.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        out = {"job_id": row["id"], "status": row["status"], "attempts": row["attempts"],
+               "max_attempts": row["max_attempts"], "created_at": row["created_at"],
+               "updated_at": row["updated_at"]}
+        if row["error"]:
+            out["error"] = row["error"]
+        if row["status"] == "queued" and row["attempts"]:
+            out["retry_at"] = row["available_at"]
+        if row["result"] is not None:
+            out["result"] = json.loads(row["result"])
+        return out
+
+    def stats(self) -> Dict[str, int]:
+        with self._connect() as db:
+            return {r[0]: r[1] for r in db.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status")}
+
+    def purge(self, older_than: float = JOB_RETENTION) -> int:
+        """Drop finished jobs (and any spooled file left) older than older_than seconds."""
+        cutoff = time.time() - older_than
+        with self._connect() as db:
+            rows = db.execute("SELECT id, path FROM jobs WHERE status IN ('done', 'failed') AND updated_at < ?",
+                              (cutoff,)).fetchall()
+            db.execute("DELETE FROM jobs WHERE status IN ('done', 'failed') AND updated_at < ?", (cutoff,))
+        for row in rows:
+            _remove(row["path"])
+        return len(rows)
+
+def _remove(path: str) -> None:
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+class _Heartbeat(threading.Thread):
+    def __init__(self, queue: JobQueue, job_id: str, owner: str):
+        super().__init__(daemon=True)
+        self.queue = queue
+        self.job_id = job_id
+        self.owner = owner
+        self.stopped = threading.Event()
+        self.lost = False
+
+    def run(self) -> None:
+        while not self.stopped.wait(self.queue.visibility / 3):
+            try:
+                if not self.queue.heartbeat(self.job_id, self.owner):
+                    self.lost = True
+                    return
+            except sqlite3.Error:
+                pass  # a busy database is retried on the next beat, well inside the lease
+
+def run_worker(queue: JobQueue, owner: Optional[str] = None, poll: float = 1.0, once: bool = False) -> None:
+    from resume_extractor import extract_any
+
+    owner = owner or f"{socket.gethostname()}:{os.getpid()}"
+    last_purge = 0.0
+    while True:
+        if time.time() - last_purge > 3600:
+            queue.purge()
+            last_purge = time.time()
+        job = queue.claim(owner)
+        if job is None:
+            if once:
+                return
+            time.sleep(poll)
+            continue
+        beat = _Heartbeat(queue, job["id"], owner)
+        beat.start()
+        try:
+            result = extract_any(job["path"], **job["options"])
+            error = None
+        except Exception as e:
+            result, error = None, f"{type(e).__name__}: {e}"
+        finally:
+            beat.stopped.set()
+            beat.join()
+        if beat.lost:
+            continue  # the job was handed to someone else; their outcome wins
+        if error is None:
+            queue.complete(job["id"], owner, result)
+            _remove(job["path"])
+        elif queue.fail(job["id"], owner, error, job["attempts"], job["max_attempts"]) \
+                and job["attempts"] >= job["max_attempts"]:
+            _remove(job["path"])
+
+def _worker_process(db_path: str, spool_dir: str) -> None:
+    run_worker(JobQueue(db_path, spool_dir))
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    wp = sub.add_parser("worker", help="claim and run jobs until interrupted")
+    wp.add_argument("--processes", type=int, default=1)
+    wp.add_argument("--once", action="store_true", help="exit when the queue is empty (single process)")
+    sp = sub.add_parser("status", help="print a job, or queue counts without an id")
+    sp.add_argument("job_id", nargs="?")
+    args = ap.parse_args()
+
+    queue = JobQueue()
+    if args.cmd == "status":
+        print(json.dumps(queue.get(args.job_id) if args.job_id else queue.stats(), indent=2))
+    elif args.processes <= 1 or args.once:
+        run_worker(queue, once=args.once)
+    else:
+        procs = [mp.Process(target=_worker_process, args=(queue.db_path, queue.spool_dir))
+                 for _ in range(args.processes)]
+        for p in procs:
+            p.start()
+        try:
+            for p in procs:
+                p.join()
+        except KeyboardInterrupt:
+            for p in procs:
+                p.terminate()
+            sys.exit(130)
+
+if __name__ == "__main__":
+    main()
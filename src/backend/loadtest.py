@@ -0,0 +1,236 @@
+"""Replay a local corpus against the extraction API to find its saturation point.
+
+    python loadtest.py corpus/ --url http://localhost:5000 --concurrency 8 --rate 2 --duration 120
+    python loadtest.py corpus/ --mode chunked --chunk-size 262144 --requests 200 --users 20
+
+Stands in for the Next.js /api/upload proxy (including its X-User-Id header). With
+--rate > 0 requests arrive as a Poisson process and latency is measured from the
+scheduled arrival, so a saturated server shows up as growing latency rather than a
+slower client (no coordinated omission); --rate 0 is a closed loop of --concurrency
+back-to-back clients. Server RSS, queue depth and shed (503) counts are polled from
+GET /stats while the test runs.
+Only the standard library is used.
+"""
+import argparse, itertools, json, math, os, random, sys, threading, time, urllib.error, urllib.request, uuid
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+SUPPORTED = {".pdf", ".docx", ".odt", ".png", ".jpg", ".jpeg", ".txt", ".rtf"}
+
+def _corpus(paths: List[str]) -> List[str]:
+    out = []
+    for p in paths:
+        if os.path.isdir(p):
+            for root, _, files in os.walk(p):
+                out += [os.path.join(root, f) for f in sorted(files) if os.path.splitext(f)[1].lower() in SUPPORTED]
+        else:
+            out.append(p)
+    return out
+
+def _call(method: str, url: str, body: Optional[bytes] = None, headers: Optional[Dict[str, str]] = None,
+          timeout: float = 600) -> Tuple[int, Dict[str, Any]]:
+    req = urllib.request.Request(url, data=body, method=method, headers=headers or {})
+    try:
+        with urllib.request.urlopen(req, timeout=timeout) as resp:
+            return resp.status, json.loads(resp.read() or b"{}")
+    except urllib.error.HTTPError as e:
+        try:
+            return e.code, json.loads(e.read() or b"{}")
+        except ValueError:
+            return e.code, {}
+    except (OSError, ValueError) as e:
+        return 0, {"error": str(e)}  # connection refused/reset, timeout, bad JSON
+
+def _multipart(path: str) -> Tuple[bytes, str]:
+    boundary = uuid.uuid4().hex
+    with open(path, "rb") as fh:
+        data = fh.read()
+    head = (f"--{boundary}\r\nContent-Disposition: form-data; name=\"file\"; "
+            f"filename=\"{os.path.basename(path)}\"\r\nContent-Type: application/octet-stream\r\n\r\n").encode()
+    return head + data + f"\r\n--{boundary}--\r\n".encode(), f"multipart/form-data; boundary={boundary}"
+
+class Target:
+    def __init__(self, url: str, mode: str, query: str, chunk_size: int):
+        self.url = url.rstrip("/")
+        self.mode = mode
+        self.query = query
+        self.chunk_size = chunk_size
+
+    def _qs(self, extra: str = "") -> str:
+        parts = [p for p in (self.query, extra) if p]
+        return "?" + "&".join(parts) if parts else ""
+
+    def send(self, path: str, user: str) -> Tuple[int, Dict[str, Any]]:
+        headers = {"X-User-Id": user}
+        if self.mode == "upload":
+            body, ctype = _multipart(path)
+            return _call("POST", self.url + "/upload" + self._qs(), body, {**headers, "Content-Type": ctype})
+
+        size = os.path.getsize(path)
+        fname = urllib.request.quote(os.path.basename(path))
+        status, res = _call("POST", self.url + "/uploads" + self._qs(f"filename={fname}&size={size}"), b"", headers)
+        if status != 201:
+            return status, res
+        upload_url = f"{self.url}/uploads/{res['upload_id']}"
+        with open(path, "rb") as fh:
+            start = 0
+            while True:
+                chunk = fh.read(self.chunk_size)
+                end = start + len(chunk) - 1
+                rng = {"Content-Range": f"bytes {start}-{max(end, start)}/{size}"} if chunk else {}
+                status, res = _call("PUT", upload_url, chunk, {**headers, **rng})
+                start += len(chunk)
+                if status != 200 or start >= size:
+                    return status, res
+
+class StatsPoller(threading.Thread):
+    def __init__(self, url: str, interval: float = 1.0):
+        super().__init__(daemon=True)
+        self.url = url.rstrip("/") + "/stats"
+        self.interval = interval
+        self.samples: List[Dict[str, Any]] = []
+        self.stopped = threading.Event()
+
+    def run(self) -> None:
+        while not self.stopped.is_set():
+            status, res = _call("GET", self.url, timeout=5)
+            if status == 200:
+                self.samples.append(res)
+            self.stopped.wait(self.interval)
+
+    def summary(self) -> Dict[str, Any]:
+        def peak(key):
+            vals = [s[key] for s in self.samples if s.get(key) is not None]
+            return max(vals) if vals else None
+        total = [s["rss_mb"] + (s.get("children_rss_mb") or 0) for s in self.samples if s.get("rss_mb") is not None]
+        queued = [s["scheduler"]["queued_small"] + s["scheduler"]["queued_large"]
+                  for s in self.samples if "scheduler" in s]
+        shed = [s["scheduler"].get("shed", 0) for s in self.samples if "scheduler" in s]
+        return {"samples": len(self.samples), "peak_rss_mb": peak("rss_mb"),
+                "peak_children_rss_mb": peak("children_rss_mb"),
+                "peak_total_rss_mb": max(total) if total else None,
+                "peak_queued": max(queued) if queued else None,
+                "shed": shed[-1] - shed[0] if shed else None}
+
+def _percentile(sorted_vals: List[float], q: float) -> float:
+    if not sorted_vals:
+        return float("nan")
+    return sorted_vals[min(len(sorted_vals) - 1, max(0, math.ceil(q * len(sorted_vals)) - 1))]
+
+def run(target: Target, files: List[str], concurrency: int, rate: float, duration: float,
+        requests: int, users: int, seed: int) -> Dict[str, Any]:
+    rng = random.Random(seed)
+    results: List[Tuple[str, int, float]] = []
+    lock = threading.Lock()
+    t_start = time.monotonic()
+    deadline = t_start + duration if duration > 0 else float("inf")
+
+    def one(path: str, user: str, scheduled: float) -> None:
+        status, res = target.send(path, user)
+        latency = time.monotonic() - scheduled
+        kind = (res.get("meta") or {}).get("detected_type") or os.path.splitext(path)[1].lower() or "?"
+        with lock:
+            results.append((kind, status, latency))
+
+    issued = itertools.count()
+    def next_request() -> Optional[Tuple[str, str]]:
+        with lock:
+            n = next(issued)
+            if time.monotonic() >= deadline or 0 < requests <= n:
+                return None
+            return rng.choice(files), f"loadtest-{n % users}"
+
+    if rate > 0:
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            scheduled = time.monotonic()
+            while True:
+                scheduled += rng.expovariate(rate)
+                time.sleep(max(0.0, scheduled - time.monotonic()))
+                job = next_request()
+                if job is None:
+                    break
+                pool.submit(one, *job, scheduled)
+    else:
+        def client() -> None:
+            while True:
+                job = next_request()
+                if job is None:
+                    return
+                one(*job, time.monotonic())
+        threads = [threading.Thread(target=client) for _ in range(concurrency)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+    elapsed = time.monotonic() - t_start
+
+    by_kind: Dict[str, List[float]] = defaultdict(list)
+    errors: Dict[str, int] = defaultdict(int)
+    for kind, status, latency in results:
+        if status == 200:
+            by_kind[kind].append(latency)
+        else:
+            errors[str(status)] += 1
+    ok = sum(len(v) for v in by_kind.values())
+    report = {"requests": len(results), "ok": ok, "seconds": round(elapsed, 2),
+              "throughput_rps": round(ok / elapsed, 3) if elapsed else 0.0,
+              "error_rate": round(1 - ok / len(results), 4) if results else 0.0,
+              "errors_by_status": dict(errors), "latency": {}}
+    for kind, vals in sorted(by_kind.items()):
+        vals.sort()
+        report["latency"][kind] = {"n": len(vals), **{f"p{int(q * 100)}": round(_percentile(vals, q), 3)
+                                                      for q in (0.5, 0.95, 0.99)}}
+    return report
+
+def _print(report: Dict[str, Any]) -> None:
+    print(f"requests {report['requests']}  ok {report['ok']}  {report['seconds']}s  "
+          f"{report['throughput_rps']} req/s  error rate {report['error_rate']:.2%}")
+    if report["errors_by_status"]:
+        print("errors:", ", ".join(f"{k or 'conn'}x{v}" for k, v in sorted(report["errors_by_status"].items())))
+    rows = [["type", "n", "p50_s", "p95_s", "p99_s"]]
+    rows += [[k, str(v["n"]), str(v["p50"]), str(v["p95"]), str(v["p99"])] for k, v in report["latency"].items()]
+    widths = [max(len(r[i]) for r in rows) for i in range(len(rows[0]))]
+    for r in rows:
+        print("  ".join(c.ljust(w) for c, w in zip(r, widths)))
+    srv = report.get("server") or {}
+    if srv.get("samples"):
+        print(f"server: peak rss {srv['peak_rss_mb']} MB, children {srv['peak_children_rss_mb']} MB, "
+              f"total {srv['peak_total_rss_mb']} MB, peak queued {srv['peak_queued']}, shed {srv['shed']}")
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("paths", nargs="+", help="corpus files or directories")
+    ap.add_argument("--url", default="http://localhost:5000")
+    ap.add_argument("--mode", choices=["upload", "chunked"], default="upload")
+    ap.add_argument("--query", default="", help="extra query string, e.g. 'lang=auto&structured=1'")
+    ap.add_argument("--chunk-size", type=int, default=1 << 20)
+    ap.add_argument("--concurrency", type=int, default=4, help="max requests in flight")
+    ap.add_argument("--rate", type=float, default=0.0, help="Poisson arrivals per second; 0 = closed loop")
+    ap.add_argument("--duration", type=float, default=60.0, help="seconds; 0 = until --requests")
+    ap.add_argument("--requests", type=int, default=0, help="stop after this many; 0 = until --duration")
+    ap.add_argument("--users", type=int, default=10, help="distinct X-User-Id values to spread load over")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--json", help="also write the report to this file")
+    args = ap.parse_args()
+    if args.duration <= 0 and args.requests <= 0:
+        ap.error("set --duration or --requests")
+
+    files = _corpus(args.paths)
+    if not files:
+        ap.error("no corpus files found")
+    poller = StatsPoller(args.url)
+    poller.start()
+    report = run(Target(args.url, args.mode, args.query, args.chunk_size), files, max(1, args.concurrency),
+                 args.rate, args.duration, args.requests, max(1, args.users), args.seed)
+    poller.stopped.set()
+    poller.join()
+    report["server"] = poller.summary()
+    _print(report)
+    if args.json:
+        with open(args.json, "w") as fh:
+            json.dump(report, fh, indent=2)
+    sys.exit(1 if report["ok"] == 0 else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,35 @@
+"""Private working directories for spools and caches.
+
+Uploads, queued jobs, extraction results, rasters and stage timings all default to
+directories under the shared temp dir, where another local user may have created the
+path first. private_dir() creates a directory 0700, or accepts an existing one only
+if it is a real directory (not a symlink) owned by this user, tightening its mode if
+needed. Anything else raises UnsafeDirectory, and callers go without the directory
+rather than read or write through it.
+"""
+import os, stat, threading
+from typing import Set
+
+class UnsafeDirectory(PermissionError):
+    pass
+
+_checked: Set[str] = set()
+_lock = threading.Lock()
+
+def private_dir(path: str) -> str:
+    """Make sure path is a directory only this user can use; returns it."""
+    with _lock:
+        if path in _checked:
+            return path
+    os.makedirs(path, mode=0o700, exist_ok=True)
+    st = os.lstat(path)
+    if stat.S_ISLNK(st.st_mode) or not stat.S_ISDIR(st.st_mode):
+        raise UnsafeDirectory(f"{path} is a symlink or not a directory")
+    if hasattr(os, "getuid"):  # Windows: ACLs of the parent apply, modes mean little
+        if st.st_uid != os.getuid():
+            raise UnsafeDirectory(f"{path} is owned by uid {st.st_uid}, not this user ({os.getuid()})")
+        if stat.S_IMODE(st.st_mode) & 0o077:
+            os.chmod(path, 0o700)
+    with _lock:
+        _checked.add(path)
+    return path
@@ -0,0 +1,113 @@
+"""Opt-in profiling of single extractions, plus an optional always-on sampler.
+
+Per request: with ALLOW_PROFILING=1 and PROFILE_TOKEN set, a request carrying
+`X-Profile-Token: <token>` runs its extract_any under cProfile in the API process. The
+token is only read from the header, never the query string, so it stays out of access
+logs. The stats are stored as PROFILE_DIR/<id>.prof (load with pstats or snakeviz)
+next to a plain-text top-N summary, and the id is returned with the response, error
+responses included. Requests without a valid token are served normally.
+
+Background: PROFILE_SAMPLE_HZ > 0 starts a thread that samples every thread's stack
+via sys._current_frames() and periodically writes the counts as collapsed stacks
+(PROFILE_DIR/sampler-<pid>.folded, the flamegraph.pl input format). At a few Hz the
+overhead is negligible. With EXTRACT_SANDBOX=1 extraction runs in child processes,
+so the sampler only sees request handling there.
+"""
+import cProfile, hmac, io, os, pstats, re, sys, tempfile, threading, time, uuid
+from collections import Counter
+from typing import Any, Callable, Optional, Tuple
+
+ALLOW_PROFILING = os.getenv("ALLOW_PROFILING", "0") == "1"
+PROFILE_TOKEN = os.getenv("PROFILE_TOKEN", "")
+PROFILE_DIR = os.getenv("PROFILE_DIR", os.path.join(tempfile.gettempdir(), "inqous_profiles"))
+PROFILE_SAMPLE_HZ = float(os.getenv("PROFILE_SAMPLE_HZ", "0"))
+PROFILE_SAMPLE_FLUSH = float(os.getenv("PROFILE_SAMPLE_FLUSH", "30"))
+
+_ID_RE = re.compile(r"^[0-9a-f]{32}$")
+
+def authorized(token: Optional[str]) -> bool:
+    """True only when profiling is allowed by configuration and token matches."""
+    if not (ALLOW_PROFILING and PROFILE_TOKEN and token):
+        return False
+    return hmac.compare_digest(token.encode(), PROFILE_TOKEN.encode())
+
+def requested(req) -> bool:
+    return authorized(req.headers.get("X-Profile-Token"))
+
+def profile_call(fn: Callable, *args: Any, **kwargs: Any) -> Tuple[Any, str]:
+    """Run fn under cProfile; returns (result, profile id). The profile is written
+    even if fn raises, so slow failures can be inspected too: the exception then
+    carries the id as its profile_id attribute."""
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    profile_id = uuid.uuid4().hex
+    prof = cProfile.Profile()
+    try:
+        return prof.runcall(fn, *args, **kwargs), profile_id
+    except BaseException as e:
+        e.profile_id = profile_id
+        raise
+    finally:
+        base = os.path.join(PROFILE_DIR, profile_id)
+        prof.dump_stats(base + ".prof")
+        buf = io.StringIO()
+        pstats.Stats(prof, stream=buf).sort_stats("cumulative").print_stats(40)
+        with open(base + ".txt", "w") as fh:
+            fh.write(buf.getvalue())
+
+def profile_path(profile_id: str, fmt: str = "prof") -> Optional[str]:
+    if not _ID_RE.match(profile_id) or fmt not in {"prof", "txt"}:
+        return None
+    path = os.path.join(PROFILE_DIR, f"{profile_id}.{fmt}")
+    return path if os.path.exists(path) else None
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+class StackSampler:
+    def __init__(self, hz: float = PROFILE_SAMPLE_HZ, flush_every: float = PROFILE_SAMPLE_FLUSH):
+        self.interval = 1.0 / hz
+        self.flush_every = flush_every
+        self.counts: Counter = Counter()
+        self.path = os.path.join(PROFILE_DIR, f"sampler-{os.getpid()}.folded")
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._loop, name="stack-sampler", daemon=True)
+
+    def start(self) -> "StackSampler":
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
+        self.flush()
+
+    def sample(self) -> None:
+        me = threading.get_ident()
+        for ident, frame in sys._current_frames().items():
+            if ident == me:
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(_frame_label(frame))
+                frame = frame.f_back
+            self.counts[";".join(reversed(stack))] += 1
+
+    def flush(self) -> None:
+        tmp = self.path + ".tmp"
+        with open(tmp, "w") as fh:
+            for stack, n in self.counts.most_common():
+                fh.write(f"{stack} {n}\n")
+        os.replace(tmp, self.path)
+
+    def _loop(self) -> None:
+        last = time.monotonic()
+        while not self._stop.wait(self.interval):
+            self.sample()
+            if time.monotonic() - last >= self.flush_every:
+                self.flush()
+                last = time.monotonic()
+
+def start_background_sampler() -> Optional[StackSampler]:
+    return StackSampler().start() if PROFILE_SAMPLE_HZ > 0 else None
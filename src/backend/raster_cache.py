@@ -0,0 +1,113 @@
+"""Bounded on-disk cache of page rasters, shared by all processes on one host.
+
+Retrying a scanned upload with another lang or profile used to render and preprocess
+every page again although only the OCR step changed. Rendered pages (BGR) and
+preprocessed pages (binarised, upscaled) are stored as .npy files under
+RASTER_CACHE_DIR, keyed by document hash, page, DPI and the preprocessing settings,
+and read back with mmap_mode="r" so a hit costs page faults rather than a decode.
+
+Writes go to a temp file and are renamed into place, so readers never see a partial
+raster. Eviction is least-recently-used by mtime (hits touch the file) down to 90%
+of RASTER_CACHE_MB.
+
+The cache is off unless RASTER_CACHE_MB is set: a balanced page costs about 60 MB
+(render plus its upscaled binarisation), so size it for the retries worth keeping.
+Rasters are page images of CVs, stored 0600 in a private_dir; when that directory is
+unsafe the cache is neither read nor written.
+"""
+import hashlib, json, os, tempfile, threading, uuid
+from typing import Any, Optional
+
+import numpy as np
+
+from private_dir import private_dir
+
+RASTER_CACHE_DIR = os.getenv("RASTER_CACHE_DIR", os.path.join(tempfile.gettempdir(), "inqous_rasters"))
+RASTER_CACHE_MB = float(os.getenv("RASTER_CACHE_MB", "0"))
+_RESCAN_EVERY = 32  # stores between directory scans; other processes write here too
+
+_lock = threading.Lock()
+_bytes: Optional[int] = None  # this process's running estimate of the cache size
+_stores = 0
+
+def enabled() -> bool:
+    return RASTER_CACHE_MB > 0
+
+def key(doc_hash: str, page: int, dpi: int, kind: str, **settings: Any) -> str:
+    """kind names the stage ("bgr", "proc"); settings is everything else that changes the pixels."""
+    raw = json.dumps({"doc": doc_hash, "page": page, "dpi": dpi, "kind": kind, **settings},
+                     sort_keys=True, default=str)
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+def _path(k: str) -> str:
+    return os.path.join(RASTER_CACHE_DIR, k[:2], k + ".npy")
+
+def get(k: str) -> Optional[np.ndarray]:
+    """A read-only memory map of the cached raster, or None."""
+    if not enabled() or not _private_dir():
+        return None
+    path = _path(k)
+    try:
+        arr = np.load(path, mmap_mode="r", allow_pickle=False)
+        os.utime(path)  # recency for LRU eviction
+        return arr
+    except (OSError, ValueError):
+        return None  # missing, evicted meanwhile, or torn by a crash before the rename
+
+def _private_dir() -> bool:
+    try:
+        private_dir(RASTER_CACHE_DIR)
+        return True
+    except OSError:
+        return False
+
+def put(k: str, arr: np.ndarray) -> None:
+    global _bytes, _stores
+    if not enabled() or not _private_dir():
+        return
+    path = _path(k)
+    tmp = f"{path}.{uuid.uuid4().hex}.tmp"
+    try:
+        os.makedirs(os.path.dirname(path), mode=0o700, exist_ok=True)
+        with os.fdopen(os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600), "wb") as fh:
+            np.save(fh, np.ascontiguousarray(arr), allow_pickle=False)
+        os.replace(tmp, path)
+    except OSError:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        return  # a full or read-only disk only costs the cache
+    with _lock:
+        _stores += 1
+        if _bytes is None or _stores % _RESCAN_EVERY == 0:
+            _bytes = None
+        else:
+            _bytes += arr.nbytes
+        if _bytes is None or _bytes > RASTER_CACHE_MB * 2**20:
+            _bytes = _evict()
+
+def _evict() -> int:
+    """Drop least recently used files until under 90% of the budget; returns the size left."""
+    files = []
+    for root, _, names in os.walk(RASTER_CACHE_DIR):
+        for name in names:
+            path = os.path.join(root, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            files.append((st.st_mtime, st.st_size, path))
+    total = sum(f[1] for f in files)
+    if total <= RASTER_CACHE_MB * 2**20:
+        return total
+    target = 0.9 * RASTER_CACHE_MB * 2**20
+    for _, size, path in sorted(files):
+        if total <= target:
+            break
+        try:
+            os.remove(path)  # open memory maps of it stay valid until closed
+            total -= size
+        except OSError:
+            pass
+    return total
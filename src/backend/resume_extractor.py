@@ -1,19 +1,49 @@
-import os, re
-from typing import Tuple, Dict, Any, List
+import os, re, sys, json, time, base64, hashlib, queue, tempfile, threading, zipfile
+import multiprocessing as mp
+from array import array
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import shared_memory
+from typing import Tuple, Dict, Any, Iterable, List, Optional
 
 import numpy as np
 import cv2
 import pdfplumber
+from pdfminer.pdftypes import PDFStream, resolve1
 from pdf2image import convert_from_path
 from PIL import Image
 import pytesseract
 
+import raster_cache
+from private_dir import private_dir
+
 # Optional deps (graceful fallbacks)
 try:
     from docx import Document
 except Exception:
     Document = None
 
+try:
+    import resource
+except Exception:  # Windows
+    resource = None
+
+try:
+    import fcntl
+except Exception:  # Windows: stage timing updates are not locked across processes
+    fcntl = None
+
+try:
+    import psutil
+except Exception:
+    psutil = None
+
+try:
+    import pypdfium2 as pdfium
+except Exception:
+    pdfium = None
+
 try:
     from odf.opendocument import load as odf_load
     from odf import text as odf_text, table as odf_table
@@ -27,19 +57,173 @@ except Exception:
 # If you set this in your shell, pdf2image will find pdftoppm/pdftocairo:
 POPPLER_PATH = os.getenv("POPPLER_PATH")  # e.g. C:\Program Files\poppler-24.07.0\Library\bin
 
+# PDFs with at least this many pages are processed in constant-memory mode unless told otherwise.
+LOW_MEMORY_PAGES = int(os.getenv("LOW_MEMORY_PAGES", "50"))
+
+# -------------- extraction profiles --------------
+
+# Settings for the whole OCR pipeline, chosen together: render dpi, NLM denoise
+# (h, template, search) or None, adaptiveThreshold (block, C), upscale before
+# Tesseract, OCR engine and whether the layout classifier may pick the psm.
+# "balanced" is the historical behaviour. Select per request (profile=...) or per
+# deployment (EXTRACT_PROFILE); expected_ocr_page_s is used until bench.py has
+# measured this host (see profile_expectations).
+PROFILES: Dict[str, Dict[str, Any]] = {
+    # skips NLM denoising, the most expensive step, and reads a 200 dpi render at 1.5x
+    "fast": {"dpi": 200, "denoise": None, "adaptive": (25, 2), "upscale": 1.5, "oem": 1,
+             "auto_psm": True, "expected_ocr_page_s": 1.2},
+    "balanced": {"dpi": 300, "denoise": (30, 7, 21), "adaptive": (31, 2), "upscale": 2, "oem": 1,
+                 "auto_psm": True, "expected_ocr_page_s": 3.0},
+    # gentler denoising keeps thin strokes; full layout analysis on every page
+    "accurate": {"dpi": 400, "denoise": (20, 7, 21), "adaptive": (41, 3), "upscale": 1.5, "oem": 1,
+                 "auto_psm": False, "expected_ocr_page_s": 6.0},
+}
+DEFAULT_PROFILE = os.getenv("EXTRACT_PROFILE", "balanced")
+PROFILE_LATENCY_PATH = os.getenv("PROFILE_LATENCY_PATH", os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "profile_latency.json"))
+
+def _profile(name: Optional[str]) -> Tuple[str, Dict[str, Any]]:
+    name = name or DEFAULT_PROFILE
+    if name not in PROFILES:
+        raise ValueError(f"Unknown extraction profile: {name}")
+    return name, PROFILES[name]
+
+def _proc_dpi(profile: Dict[str, Any]) -> float:
+    """Resolution of the raster Tesseract sees."""
+    return profile["dpi"] * profile["upscale"]
+
+def profile_expectations() -> Dict[str, Dict[str, Any]]:
+    """Seconds per OCR page for each profile: bench.py measurements where present,
+    the built-in estimates otherwise."""
+    try:
+        with open(PROFILE_LATENCY_PATH) as fh:
+            measured = json.load(fh)
+    except (OSError, ValueError):
+        measured = {}
+    out = {}
+    for name, p in PROFILES.items():
+        m = measured.get(name) or {}
+        out[name] = {"ocr_page_seconds": m.get("ocr_page_seconds", p["expected_ocr_page_s"]),
+                     "source": "bench" if m else "default",
+                     **{k: m[k] for k in ("pages", "measured_at") if k in m}}
+    return out
+
+def _profile_cost_ratio(name: Optional[str]) -> float:
+    """OCR cost of a profile relative to "balanced", which stage timings are kept in."""
+    exp = profile_expectations()
+    return exp.get(name or DEFAULT_PROFILE, exp["balanced"])["ocr_page_seconds"] / exp["balanced"]["ocr_page_seconds"]
+
 # -------------- helpers --------------
 
-def _preprocess_bgr_for_ocr(bgr: np.ndarray) -> np.ndarray:
+def _rss_mb() -> Optional[float]:
+    """Current resident set size in MB, or None where it cannot be read cheaply."""
+    try:
+        with open("/proc/self/statm") as fh:
+            return int(fh.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except Exception:
+        pass
+    if psutil is not None:
+        return psutil.Process().memory_info().rss / 2**20
+    return None
+
+def _max_rss_mb() -> Optional[float]:
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 2**20 if sys.platform == "darwin" else peak / 2**10  # bytes on macOS, KB elsewhere
+
+def _note_rss(peaks: Dict[str, float], stage: str) -> None:
+    rss = _rss_mb()
+    if rss is not None:
+        peaks[stage] = round(max(peaks.get(stage, 0.0), rss), 1)
+
+def _release_page(pdf, page) -> None:
+    # Drop the page's parsed layout objects and pdfminer's resolved-object cache
+    # (decoded content streams, fonts, images) so memory does not grow with page count.
+    flush = getattr(page, "close", None) or getattr(page, "flush_cache", None)
+    if flush:
+        flush()
+    cached = getattr(pdf.doc, "_cached_objs", None)
+    if isinstance(cached, dict):
+        cached.clear()
+
+def _render_page(path: str, page_number: int, dpi: int = 300, grayscale: bool = False) -> Optional[Image.Image]:
+    poppler = os.getenv("POPPLER_PATH") or None
+    images = convert_from_path(path, dpi=dpi, first_page=page_number, last_page=page_number,
+                               poppler_path=poppler, grayscale=grayscale)
+    return images[0] if images else None
+
+# Blank-page probe: pages whose ink ratio or contrast falls below these are not OCRed.
+SKIP_BLANK_PAGES = os.getenv("SKIP_BLANK_PAGES", "1") == "1"
+BLANK_PROBE_DPI = 36
+BLANK_INK_RATIO = float(os.getenv("BLANK_INK_RATIO", "0.002"))
+BLANK_MIN_STD = float(os.getenv("BLANK_MIN_STD", "4.0"))
+
+def _is_blank(gray: np.ndarray) -> bool:
+    # ignore a 5% margin where scanner edges and punch holes show up
+    h, w = gray.shape[:2]
+    core = gray[h // 20:h - h // 20, w // 20:w - w // 20]
+    if core.size == 0:
+        return True
+    ink = float(np.count_nonzero(core < 160)) / core.size
+    return ink < BLANK_INK_RATIO or float(core.std()) < BLANK_MIN_STD
+
+def _page_is_blank(path: str, page_number: int) -> bool:
+    img = _render_page(path, page_number, dpi=BLANK_PROBE_DPI, grayscale=True)
+    if img is None:
+        return True
+    try:
+        return _is_blank(np.asarray(img))
+    finally:
+        img.close()
+
+def _upscaled_shape(h: int, w: int, profile: Dict[str, Any]) -> Tuple[int, int]:
+    return int(h * profile["upscale"]), int(w * profile["upscale"])
+
+def _preprocess_bgr_for_ocr(bgr: np.ndarray, out=None, profile: Optional[Dict[str, Any]] = None) -> np.ndarray:
+    """out: optional writable buffer (e.g. the shared-memory block bgr lives in) that
+    receives the result; bgr is fully consumed before it is overwritten."""
+    p = profile or PROFILES["balanced"]
     gray = cv2.cvtColor(bgr, cv2.COLOR_BGR2GRAY)
-    den = cv2.fastNlMeansDenoising(gray, None, 30, 7, 21)
-    thr = cv2.adaptiveThreshold(den, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
-                                cv2.THRESH_BINARY, 31, 2)
+    if p["denoise"]:
+        gray = cv2.fastNlMeansDenoising(gray, None, *p["denoise"])
+    thr = cv2.adaptiveThreshold(gray, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
+                                cv2.THRESH_BINARY, *p["adaptive"])
     blur = cv2.GaussianBlur(thr, (3, 3), 0)
-    up = cv2.resize(blur, None, fx=2, fy=2, interpolation=cv2.INTER_LINEAR)
+    uh, uw = _upscaled_shape(*blur.shape, p)
+    if out is None:
+        if (uh, uw) == blur.shape:
+            return blur
+        return cv2.resize(blur, (uw, uh), interpolation=cv2.INTER_LINEAR)
+    up = np.ndarray((uh, uw), np.uint8, buffer=out)
+    if (uh, uw) == blur.shape:
+        np.copyto(up, blur)
+    else:
+        cv2.resize(blur, (uw, uh), dst=up, interpolation=cv2.INTER_LINEAR)
     return up
 
-def _ocr_array(arr: np.ndarray, lang: str) -> str:
-    return pytesseract.image_to_string(Image.fromarray(arr), lang=lang, config="--oem 1 --psm 3")
+def _ocr_array(arr: np.ndarray, lang: str, config: str = "--oem 1 --psm 3") -> str:
+    return pytesseract.image_to_string(Image.fromarray(arr), lang=lang, config=config)
+
+def _ocr_array_data(arr: np.ndarray, lang: str,
+                    config: str = "--oem 1 --psm 3") -> Tuple[str, Dict[str, List]]:
+    """One Tesseract pass returning both the page text and its word-level data."""
+    data = pytesseract.image_to_data(Image.fromarray(arr), lang=lang, config=config,
+                                     output_type=pytesseract.Output.DICT)
+    lines: List[str] = []
+    key = None
+    for i, word in enumerate(data["text"]):
+        if int(data["level"][i]) != 5 or not word.strip():
+            continue
+        k = (data["block_num"][i], data["par_num"][i], data["line_num"][i])
+        if k == key:
+            lines[-1] += " " + word
+            continue
+        if key is not None and k[:2] != key[:2]:
+            lines.append("")  # paragraph break
+        lines.append(word)
+        key = k
+    return "\n".join(lines), data
 
 def _normalize(text: str) -> str:
     text = re.sub(r"(\w)-\n(\w)", r"\1\2", text)    # dehyphenate across line breaks
@@ -64,6 +248,15 @@ def _strip_headers_footers(pages: List[str]) -> List[str]:
         out.append("\n".join([l for l in lines if l not in common]))
     return out
 
+def _text_layer_ok(text: Optional[str]) -> bool:
+    s = (text or "").strip()
+    if not s:
+        return False
+    if s.count("(cid:") * 9 > len(s) // 10 or s.count("\ufffd") > len(s) * 0.05:
+        return False
+    visible = [ch for ch in s if not ch.isspace()]
+    return sum(ch.isalnum() for ch in visible) / len(visible) >= 0.4
+
 def _quality(text: str) -> List[str]:
     w = []
     s = text.strip()
@@ -80,45 +273,1207 @@ def _quality(text: str) -> List[str]:
         w.append("High symbol ratio; layout/encoding noise detected.")
     return w
 
+# -------------- structured output --------------
+
+class WordTable:
+    """Words with their boxes, page index and OCR confidence, stored column-wise in
+    packed arrays. Boxes are PDF points for PDF pages and source pixels for images;
+    conf is -1 for words taken from a text layer."""
+
+    _COLUMNS = (("page", "H"), ("x0", "f"), ("y0", "f"), ("x1", "f"), ("y1", "f"), ("conf", "b"))
+
+    def __init__(self):
+        self.words: List[str] = []
+        for name, code in self._COLUMNS:
+            setattr(self, name, array(code))
+
+    def __len__(self) -> int:
+        return len(self.words)
+
+    def add(self, page: int, word: str, x0: float, y0: float, x1: float, y1: float, conf: int = -1) -> None:
+        self.words.append(word)
+        self.page.append(page)
+        self.x0.append(x0)
+        self.y0.append(y0)
+        self.x1.append(x1)
+        self.y1.append(y1)
+        self.conf.append(max(-1, min(100, conf)))
+
+    def add_plumber_words(self, page: int, words: List[Dict[str, Any]]) -> None:
+        for w in words:
+            self.add(page, w["text"], w["x0"], w["top"], w["x1"], w["bottom"])
+
+    def add_tesseract_data(self, page: int, data: Dict[str, List], scale: float,
+                           offset: Tuple[float, float] = (0.0, 0.0), rows: Optional[List[int]] = None) -> None:
+        """Append word rows of image_to_data output (all, or just `rows`); scale maps OCR
+        pixels to output units and offset is added after scaling."""
+        for i in range(len(data["text"])) if rows is None else rows:
+            word = data["text"][i]
+            if int(data["level"][i]) != 5 or not word.strip():
+                continue
+            x, y = offset[0] + data["left"][i] * scale, offset[1] + data["top"][i] * scale
+            self.add(page, word.strip(), x, y, x + data["width"][i] * scale, y + data["height"][i] * scale,
+                     int(float(data["conf"][i])))
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Compact JSON form: newline-joined words plus base64 little-endian columns."""
+        out: Dict[str, Any] = {"count": len(self.words), "text": "\n".join(self.words),
+                               "columns": {name: code for name, code in self._COLUMNS}}
+        for name, _ in self._COLUMNS:
+            col = getattr(self, name)
+            if sys.byteorder == "big":
+                col = array(col.typecode, col)
+                col.byteswap()
+            out[name] = base64.b64encode(col.tobytes()).decode("ascii")
+        return out
+
+    @classmethod
+    def from_dict(cls, d: Dict[str, Any]) -> "WordTable":
+        table = cls()
+        table.words = d["text"].split("\n") if d["count"] else []
+        for name, code in cls._COLUMNS:
+            col = array(code)
+            col.frombytes(base64.b64decode(d[name]))
+            if sys.byteorder == "big":
+                col.byteswap()
+            setattr(table, name, col)
+        return table
+
+# -------------- OCR language detection --------------
+
+# Tesseract OSD script -> language pack used for lang="auto".
+SCRIPT_LANGS = {"Latin": "eng", "Cyrillic": "rus", "Greek": "ell", "Arabic": "ara", "Hebrew": "heb",
+                "Devanagari": "hin", "Thai": "tha", "Hangul": "kor", "Japanese": "jpn",
+                "Han": "chi_sim", "HanS": "chi_sim", "HanT": "chi_tra"}
+
+# Latin-script packs that lang="auto" chooses between by stopword frequency on the sample.
+AUTO_LATIN_LANGS = os.getenv("OCR_AUTO_LANGS", "eng+deu+fra+spa+ita+por+nld").split("+")
+
+_STOPWORDS = {
+    "eng": {"the", "and", "of", "to", "in", "with", "for", "at", "on", "as"},
+    "deu": {"und", "der", "die", "das", "mit", "für", "von", "bei", "im", "zu"},
+    "fra": {"et", "le", "la", "les", "des", "du", "pour", "avec", "en", "au"},
+    "spa": {"y", "el", "la", "los", "las", "del", "con", "para", "en", "por"},
+    "ita": {"e", "il", "la", "di", "del", "della", "con", "per", "in", "presso"},
+    "por": {"e", "o", "os", "do", "da", "dos", "com", "para", "em", "na"},
+    "nld": {"en", "de", "het", "van", "met", "voor", "een", "bij", "in", "op"},
+}
+
+# Text lines of the first OCR page that lang="auto" reads: enough words to count stopwords.
+LANG_SAMPLE_LINES = int(os.getenv("OCR_LANG_SAMPLE_LINES", "6"))
+
+_LANG_CACHE: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+_LANG_CACHE_SIZE = 256
+_lang_cache_lock = threading.Lock()  # scheduler threads share it
+
+def _file_digest(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as fh:
+        for chunk in iter(lambda: fh.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+def _lang_sample(arr: np.ndarray) -> np.ndarray:
+    """The first LANG_SAMPLE_LINES text lines below the letterhead; every candidate
+    pack reads it, so it is kept to a few lines rather than a third of the page."""
+    h, w = arr.shape[:2]
+    band = arr[int(h * 0.12):int(h * 0.45), int(w * 0.05):int(w * 0.95)]
+    gray = band if band.ndim == 2 else cv2.cvtColor(band, cv2.COLOR_BGR2GRAY)
+    inked = ((gray < 128).sum(axis=1) > max(1, gray.shape[1] // 200)).astype(np.int8)
+    edges = np.flatnonzero(np.diff(np.concatenate(([0], inked, [0]))))
+    lines = [(a, b) for a, b in zip(edges[0::2], edges[1::2]) if b - a >= 4]  # runs of inked rows
+    if lines:
+        last = lines[min(len(lines), LANG_SAMPLE_LINES) - 1][1]
+        band = band[max(0, lines[0][0] - 4):last + 4]
+    if band.shape[0] > 1600:
+        band = cv2.resize(band, None, fx=0.5, fy=0.5, interpolation=cv2.INTER_AREA)
+    return band
+
+def _detect_lang(arr: np.ndarray) -> Dict[str, Any]:
+    sample = Image.fromarray(_lang_sample(arr))
+    try:
+        installed = set(pytesseract.get_languages(config=""))
+    except Exception:
+        installed = {"eng"}
+    script, conf = "Latin", None
+    try:
+        osd = pytesseract.image_to_osd(sample, output_type=pytesseract.Output.DICT)
+        script, conf = osd.get("script") or "Latin", osd.get("script_conf")
+    except Exception:
+        pass  # no osd pack or too little text: assume Latin
+    if script != "Latin":
+        lang = SCRIPT_LANGS.get(script, "eng")
+        return {"lang": lang if lang in installed else "eng", "script": script, "confidence": conf}
+
+    candidates = [l for l in AUTO_LATIN_LANGS if l in installed] or ["eng"]
+    text = pytesseract.image_to_string(sample, lang="+".join(candidates), config="--oem 1 --psm 6")
+    words = re.findall(r"[^\W\d_]+", text.lower())
+    scores = {l: sum(w in _STOPWORDS.get(l, ()) for w in words) for l in candidates}
+    best = max(candidates, key=lambda l: (scores[l], l == "eng"))
+    return {"lang": best, "script": script,
+            "confidence": round(scores[best] / len(words), 3) if words else conf}
+
+def _ocr_lang(state: Dict[str, Any], arr: np.ndarray) -> str:
+    """Resolve lang="auto" once per document, from a sample of its first OCR page."""
+    if state["lang"] != "auto":
+        return state["lang"]
+    if "detected" not in state:
+        key = state.get("doc_hash") or _file_digest(state["path"])
+        with _lang_cache_lock:
+            hit = _LANG_CACHE.get(key)
+            if hit is not None:
+                _LANG_CACHE.move_to_end(key)
+        if hit is None:
+            hit = _detect_lang(arr)  # outside the lock: other documents need not wait for it
+            with _lang_cache_lock:
+                _LANG_CACHE[key] = hit
+                if len(_LANG_CACHE) > _LANG_CACHE_SIZE:
+                    _LANG_CACHE.popitem(last=False)
+        state["detected"] = hit
+    return state["detected"]["lang"]
+
+def _lang_meta(state: Dict[str, Any]) -> Dict[str, Any]:
+    if "detected" not in state:
+        return {"ocr_lang": state["lang"]} if state["lang"] != "auto" else {}
+    return {"ocr_lang": state["detected"]["lang"], "ocr_lang_detected": state["detected"]}
+
+# -------------- pdf triage --------------
+
+# A page whose image XObjects cover at least this share of the page is treated as a scan.
+SCAN_IMAGE_COVERAGE = 0.5
+
+_TEXT_SHOW_RE = re.compile(rb"[)>\]]\s*(?:Tj|TJ|'|\")")
+_RENDER_MODE_RE = re.compile(rb"(?<![\w.])(\d)\s+Tr(?!\w)")
+_NUM = rb"[-+]?(?:\d+\.?\d*|\.\d+)"
+_CM_OR_DO_RE = re.compile(rb"((?:" + _NUM + rb"\s+){6})cm(?!\w)|/([^\s/\[\]()<>{}%]+)\s+Do(?!\w)")
+# rectangles and line segments, with their operands so words in strings do not count: table rulings
+_RULE_RE = re.compile(rb"(?:" + _NUM + rb"\s+){4}re(?!\w)|(?:" + _NUM + rb"\s+){2}l(?!\w)")
+
+def _pdf_name(obj) -> str:
+    return getattr(obj, "name", obj if isinstance(obj, str) else "")
+
+def _font_mappable(font) -> bool:
+    font = resolve1(font)
+    if not isinstance(font, dict):
+        return True
+    if "ToUnicode" in font:
+        return True
+    return _pdf_name(resolve1(font.get("Subtype"))) in {"Type1", "TrueType", "MMType1"}
+
+def _scan_content(data: bytes, xobjects: Dict[str, Any], stats: Dict[str, Any], depth: int = 0) -> None:
+    stats["text_ops"] += len(_TEXT_SHOW_RE.findall(data))
+    stats["render_modes"].update(int(m) for m in _RENDER_MODE_RE.findall(data))
+    stats["rulings"] += len(_RULE_RE.findall(data))
+    area = 0.0
+    for m in _CM_OR_DO_RE.finditer(data):
+        if m.group(1):
+            a, b, c, d = (float(v) for v in m.group(1).split()[:4])
+            area = abs(a * d - b * c)
+            continue
+        xo = resolve1(xobjects.get(m.group(2).decode("latin1")))
+        if not isinstance(xo, PDFStream):
+            continue
+        subtype = _pdf_name(resolve1(xo.attrs.get("Subtype")))
+        if subtype == "Image":
+            stats["images"] += 1
+            stats["image_area"] += area
+            stats["image_px"] = max(stats["image_px"], (int(resolve1(xo.attrs.get("Width", 0)) or 0),
+                                                        int(resolve1(xo.attrs.get("Height", 0)) or 0)))
+        elif subtype == "Form" and depth < 2:
+            res = resolve1(xo.attrs.get("Resources")) or {}
+            _collect_fonts(res, stats)
+            try:
+                _scan_content(xo.get_data(), resolve1(res.get("XObject")) or {}, stats, depth + 1)
+            except Exception:
+                pass
+
+def _collect_fonts(resources: Dict[str, Any], stats: Dict[str, Any]) -> None:
+    for name, font in (resolve1(resources.get("Font")) or {}).items():
+        stats["fonts"] += 1
+        if not _font_mappable(font):
+            stats["unmappable_fonts"] += 1
+
+def _triage_page(page) -> Dict[str, Any]:
+    """Classify a page as text/scanned/mixed from its resources and raw content
+    stream only; no pdfminer layout analysis or character objects are built. A page
+    whose resources or content cannot be read is mixed: its text layer is still tried."""
+    stats: Dict[str, Any] = {"fonts": 0, "unmappable_fonts": 0, "text_ops": 0, "images": 0,
+                             "image_area": 0.0, "image_px": (0, 0), "render_modes": set(), "rulings": 0}
+    error = None
+    try:
+        res = resolve1(page.page_obj.resources) or {}
+        _collect_fonts(res, stats)
+        xobjects = resolve1(res.get("XObject")) or {}
+        for stream in page.page_obj.contents or []:
+            stream = resolve1(stream)
+            if isinstance(stream, PDFStream):
+                _scan_content(stream.get_data(), xobjects, stats)
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+
+    page_area = float(page.width * page.height) or 1.0
+    coverage = min(1.0, stats["image_area"] / page_area)
+    # render mode 3 only: an invisible OCR layer over a scan, usually good enough to keep
+    invisible_only = stats["render_modes"] == {3}
+    has_text = stats["text_ops"] > 0 and stats["fonts"] > 0
+    if error is not None:
+        kind = "mixed"
+    elif not has_text:
+        kind = "scanned"
+    elif invisible_only or coverage >= SCAN_IMAGE_COVERAGE or stats["unmappable_fonts"] == stats["fonts"]:
+        kind = "mixed"
+    else:
+        kind = "text"
+    return {"class": kind, "text_ops": stats["text_ops"], "fonts": stats["fonts"],
+            "unmappable_fonts": stats["unmappable_fonts"], "images": stats["images"],
+            "image_coverage": round(coverage, 3), "image_px": stats["image_px"], "rulings": stats["rulings"],
+            "error": error}
+
+# page class -> extraction method, fixed before any text extraction or rendering
+_PAGE_PLAN = {"text": "text", "mixed": "text_or_ocr", "scanned": "ocr"}
+
+# -------------- pdf text backends --------------
+
+class PdfTextBackend:
+    """Text-layer extractor for one open document; page indexes are 0-based."""
+    name = ""
+
+    def __init__(self, path: str, pdf):
+        self.path = path
+        self.pdf = pdf
+
+    def page_text(self, index: int) -> Optional[str]:
+        raise NotImplementedError
+
+    def multi_column(self, index: int) -> bool:
+        """Whether page_text(index) saw text side by side (columns, table cells), whose
+        reading order only layout analysis gets right."""
+        return False
+
+    def close(self) -> None:
+        pass
+
+class PlumberTextBackend(PdfTextBackend):
+    """pdfminer layout analysis in pure Python: slow, but the most faithful reading order."""
+    name = "pdfplumber"
+
+    def page_text(self, index: int) -> Optional[str]:
+        return self.pdf.pages[index].extract_text(x_tolerance=2, y_tolerance=2, keep_blank_chars=False)
+
+    def column_text(self, index: int) -> Optional[str]:
+        """page_text for a page with columns: plain extraction reads straight across the
+        gutter, so each column (below a full-width header) is cropped and read on its own."""
+        page = self.pdf.pages[index]
+        split = _column_split(page)
+        if split is None:
+            return self.page_text(index)
+        x, y = split
+        x0, top, x1, bottom = page.bbox
+        crops = ([(x0, top, x1, y)] if y > top else []) + [(x0, y, x, bottom), (x, y, x1, bottom)]
+        parts = [page.crop(box).extract_text(x_tolerance=2, y_tolerance=2, keep_blank_chars=False)
+                 for box in crops]
+        return "\n".join(p for p in parts if p)
+
+class PdfiumTextBackend(PdfTextBackend):
+    """Native PDFium text extraction (pypdfium2)."""
+    name = "pdfium"
+
+    def __init__(self, path: str, pdf):
+        super().__init__(path, pdf)
+        self.doc = pdfium.PdfDocument(path)
+        self.columns = set()  # page indexes whose text runs sit side by side
+
+    def page_text(self, index: int) -> Optional[str]:
+        page = self.doc[index]
+        try:
+            textpage = page.get_textpage()
+            try:
+                rects = [textpage.get_rect(i) for i in range(textpage.count_rects())]
+                if _side_by_side(rects, page.get_width()):
+                    self.columns.add(index)
+                return textpage.get_text_range()
+            finally:
+                textpage.close()
+        finally:
+            page.close()
+
+    def multi_column(self, index: int) -> bool:
+        return index in self.columns
+
+    def close(self) -> None:
+        self.doc.close()
+
+_COLUMN_GAP = 0.03    # horizontal gap between text runs on one line, as a share of the page width
+_COLUMN_LINES = 0.3   # share of lines split by such a gap for the page to count as columns/table
+_TABLE_RULINGS = 6    # rectangle and line operators that, with side-by-side text, make a ruled table
+
+def _side_by_side(rects: List[Tuple[float, float, float, float]], width: float) -> bool:
+    """Whether enough lines of (left, bottom, right, top) text runs hold runs separated
+    by a column-sized gap."""
+    rows: List[List[Tuple[float, float]]] = []
+    last = None
+    for left, bottom, right, top in sorted(rects, key=lambda r: (-r[1], r[0])):
+        if last is None or abs(bottom - last) > 0.5 * (top - bottom):
+            rows.append([])
+            last = bottom
+        rows[-1].append((left, right))
+    if len(rows) < 3:
+        return False
+    gap = _COLUMN_GAP * width
+    split = sum(any(b[0] - a[1] >= gap for a, b in zip(row, row[1:])) for row in map(sorted, rows))
+    return split >= _COLUMN_LINES * len(rows)
+
+def _column_split(page) -> Optional[Tuple[float, float]]:
+    """(gutter x, top of the columns) for a two-column page, from the words' x extents:
+    the gutter is the widest band few lines reach into; leading lines that fill it are a
+    full-width header. None when there is no single clean split."""
+    words = page.extract_words(x_tolerance=2, y_tolerance=2)
+    x0, top, x1, _ = page.bbox
+    width = int(x1 - x0) + 1
+    lines: List[Tuple[float, np.ndarray]] = []
+    for w in sorted(words, key=lambda w: (round(w["top"]), w["x0"])):
+        if not lines or abs(w["top"] - lines[-1][0]) > 2:
+            lines.append((w["top"], np.zeros(width, bool)))
+        lines[-1][1][max(0, int(w["x0"] - x0)):int(w["x1"] - x0) + 1] = True
+    if len(lines) < 3:
+        return None
+    reach = np.sum([cov for _, cov in lines], axis=0)
+    gutters = [(a, b) for a, b in _runs(reach <= 0.1 * len(lines))
+               if b - a >= _COLUMN_GAP * width and a > 0.15 * width and b < 0.85 * width]
+    if not gutters:
+        return None
+    a, b = max(gutters, key=lambda g: g[1] - g[0])
+    crossing = [int(cov[a:b].sum()) > (b - a) // 2 for _, cov in lines]
+    k = crossing.index(False) if not all(crossing) else len(crossing)
+    if any(crossing[k:]) or k > 0.3 * len(lines):
+        return None
+    y = top if k == 0 else (max(w["bottom"] for w in words if w["top"] <= lines[k - 1][0] + 2) + lines[k][0]) / 2
+    return x0 + (a + b) / 2, y
+
+PDF_TEXT_BACKENDS = {"pdfium": PdfiumTextBackend, "pdfplumber": PlumberTextBackend}
+DEFAULT_PDF_TEXT_BACKEND = os.getenv("PDF_TEXT_BACKEND", "pdfium")
+
+def _open_text_backend(name: Optional[str], path: str, pdf) -> PdfTextBackend:
+    name = name or DEFAULT_PDF_TEXT_BACKEND
+    if name not in PDF_TEXT_BACKENDS:
+        raise ValueError(f"Unknown PDF text backend: {name}")
+    if name == "pdfium" and pdfium is None:
+        name = "pdfplumber"
+    try:
+        return PDF_TEXT_BACKENDS[name](path, pdf)
+    except Exception:
+        if name == "pdfplumber":
+            raise
+        return PlumberTextBackend(path, pdf)
+
+def _safe_page_text(backend: PdfTextBackend, index: int, columns: bool = False) -> Optional[str]:
+    try:
+        return backend.column_text(index) if columns else backend.page_text(index)
+    except Exception:
+        return None
+
+# -------------- page layout --------------
+
+# Choose the Tesseract page segmentation mode from projection profiles of the binarized
+# page: one column -> psm 6 (uniform lines) or 4 (mixed sizes), two columns -> each
+# column OCRed on its own, anything else -> psm 3 full layout analysis.
+OCR_AUTO_PSM = os.getenv("OCR_AUTO_PSM", "1") == "1"
+_LAYOUT_DPI = 150          # the classifier looks at a copy downscaled to this resolution
+_GUTTER_MIN_FRAC = 0.015   # narrowest column gutter, as a fraction of the page width
+_UNIFORM_LINE_CV = 0.25    # line-height spread below which a column is one uniform block
+
+def _runs(mask: np.ndarray) -> List[Tuple[int, int]]:
+    """[start, end) runs of True in a 1-D boolean array."""
+    d = np.diff(np.concatenate(([0], mask.astype(np.int8), [0])))
+    return list(zip(np.flatnonzero(d == 1).tolist(), np.flatnonzero(d == -1).tolist()))
+
+def _text_lines(ink: np.ndarray) -> List[Tuple[int, int]]:
+    return _runs(ink.sum(axis=1) > 1)  # a lone pixel is noise, not a line
+
+def _block_psm(ink: np.ndarray) -> int:
+    heights = np.array([e - s for s, e in _text_lines(ink)], float)
+    if heights.size < 2:
+        return 6
+    return 6 if heights.std() / heights.mean() < _UNIFORM_LINE_CV else 4
+
+def _choose_layout(proc: np.ndarray, dpi: float = 600) -> Dict[str, Any]:
+    """{"mode": "psm3" | "psm4" | "psm6"} or {"mode": "columns", "regions": [(x0, y0, x1, y1, psm)]}
+    in proc pixels (proc is at `dpi`); a full-width header above the columns becomes its own region."""
+    scale = min(1.0, _LAYOUT_DPI / dpi)
+    small = cv2.resize(proc, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+    ink = small < 128
+    rows = np.flatnonzero(ink.sum(axis=1) > 1)
+    cols = np.flatnonzero(ink.sum(axis=0) > 1)
+    if rows.size == 0 or cols.size == 0:
+        return {"mode": "psm3"}
+    oy, ox = int(rows[0]), int(cols[0])
+    ink = ink[oy:rows[-1] + 1, ox:cols[-1] + 1]
+    h, w = ink.shape
+    lines = _text_lines(ink)
+    heights = [e - s for s, e in lines]
+    if len(lines) < 3 or max(heights) > 4 * float(np.median(heights)):
+        return {"mode": "psm3"}  # sparse page, or photos/tables/rules among the text
+
+    # gutters are measured below the top lines so a full-width name header does not hide them
+    body = ink[lines[len(lines) * 3 // 10][0]:]
+    specks = lambda rows: max(1, rows // 100)  # stray pixels an empty column may hold
+    empty = body.sum(axis=0) <= specks(body.shape[0])
+    gutters = [(a, b) for a, b in _runs(empty)
+               if b - a >= _GUTTER_MIN_FRAC * small.shape[1] and a > 0.15 * w and b < 0.85 * w]
+    if not gutters:
+        return {"mode": f"psm{_block_psm(ink)}"}
+    if len(gutters) > 1:
+        return {"mode": "psm3"}
+    a, b = gutters[0]
+    split = (a + b) // 2
+    left, right = int(ink[:, :split].sum()), int(ink[:, split:].sum())
+    if min(left, right) < 0.05 * (left + right):
+        return {"mode": f"psm{_block_psm(ink)}"}
+
+    # only a leading run of lines (the header) may cross the gutter, i.e. leave less than half
+    # of it clear; a long column line that just reaches into it does not count
+    gap = (b - a + 1) // 2
+    crossing = [not any(y - x >= gap for x, y in _runs(ink[s:e, a:b].sum(axis=0) <= specks(e - s)))
+                for s, e in lines]
+    if all(crossing):
+        return {"mode": "psm3"}
+    k = crossing.index(False)
+    if any(crossing[k:]) or k > 0.3 * len(lines):
+        return {"mode": "psm3"}
+    top = (lines[k - 1][1] + lines[k][0]) // 2 if k else 0
+
+    f = 1 / scale
+    H, W = proc.shape[:2]
+    px = lambda v, o, lim: min(lim, int(round((v + o) * f)))
+    y_top, x_split = px(top, oy, H) if k else 0, px(split, ox, W)
+    regions = []
+    if k:
+        regions.append((0, 0, W, y_top, _block_psm(ink[:top])))
+    regions.append((0, y_top, x_split, H, _block_psm(ink[top:, :split])))
+    regions.append((x_split, y_top, W, H, _block_psm(ink[top:, split:])))
+    return {"mode": "columns", "regions": regions}
+
+def _ocr_layout(proc: np.ndarray, lang: str, want_data: bool,
+                profile: Optional[Dict[str, Any]] = None) -> Tuple[str, Optional[Dict[str, List]], str]:
+    """OCR a preprocessed page with the segmentation its layout calls for.
+    Returns (text, image_to_data dict in proc pixels or None, mode)."""
+    p = profile or PROFILES["balanced"]
+    auto = OCR_AUTO_PSM and p["auto_psm"]
+    layout = _choose_layout(proc, _proc_dpi(p)) if auto else {"mode": "psm3"}
+    mode = layout["mode"]
+    if mode != "columns":
+        config = f"--oem {p['oem']} --psm {mode[3:]}"
+        if want_data:
+            return (*_ocr_array_data(proc, lang, config), mode)
+        return _ocr_array(proc, lang, config), None, mode
+
+    texts: List[str] = []
+    merged: Dict[str, List] = {}
+    for x0, y0, x1, y1, psm in layout["regions"]:
+        crop = proc[y0:y1, x0:x1]
+        config = f"--oem {p['oem']} --psm {psm}"
+        if not want_data:
+            texts.append(_ocr_array(crop, lang, config).strip())
+            continue
+        text, data = _ocr_array_data(crop, lang, config)
+        texts.append(text.strip())
+        data["left"] = [v + x0 for v in data["left"]]
+        data["top"] = [v + y0 for v in data["top"]]
+        for key, vals in data.items():
+            merged.setdefault(key, []).extend(vals)
+    return "\n\n".join(t for t in texts if t), merged if want_data else None, mode
+
+def _psm_meta(ocr: Dict[str, Any], page_numbers: Iterable[int]) -> Dict[str, Any]:
+    modes = ocr.get("psm_modes")
+    if not modes:
+        return {}
+    return {"psm_modes": [modes.get(n) for n in page_numbers]}
+
+# -------------- repeated page bands --------------
+
+# Letterheads and footers on multi-page scans are the same pixels on every page. The
+# top and bottom edge strips of each OCR page are dHashed; strips matching the same
+# strip of a recent page are blanked before OCR, so the band is only read once.
+MASK_REPEATED_BANDS = os.getenv("MASK_REPEATED_BANDS", "1") == "1"
+_BAND_STRIP = 1 / 40            # strip height, fraction of the page height
+_BAND_TOP, _BAND_BOTTOM = 8, 6  # strips examined from each edge inwards
+_BAND_HASH = (64, 8)            # dHash grid per strip
+_BAND_DEAD_ZONE = 8             # gray-level steps smaller than this are "flat", not a bit
+_BAND_MAX_DIST = 0.3            # max share of opposite gradients among the non-flat cells
+_BAND_HISTORY = 3               # earlier pages a band may repeat from
+_BAND_MAX_SHIFT = 0.005         # scanner feed jitter searched, fraction of the page height
+
+def _strip_sig(bgr_strip: np.ndarray) -> Tuple[bool, Optional[np.ndarray]]:
+    """(blank, gradient signs). A dHash with a dead zone: steps within paper noise are
+    0 rather than a coin-flip bit, so two scans of the same band compare equal."""
+    gray = cv2.cvtColor(bgr_strip, cv2.COLOR_BGR2GRAY)
+    if np.count_nonzero(gray < 160) < BLANK_INK_RATIO * gray.size:
+        return True, None
+    w, h = _BAND_HASH
+    small = cv2.resize(gray, (w + 1, h), interpolation=cv2.INTER_AREA).astype(np.int16)
+    d = small[:, 1:] - small[:, :-1]
+    return False, np.sign(d) * (np.abs(d) >= _BAND_DEAD_ZONE)
+
+def _sig_match(a, b) -> bool:
+    if a[0] or b[0]:
+        return a[0] == b[0]
+    active = np.count_nonzero(a[1] | b[1])
+    if not active:
+        return True
+    return np.count_nonzero(a[1] != b[1]) <= _BAND_MAX_DIST * active
+
+def _ink_row(bgr: np.ndarray, y: int) -> bool:
+    return bool((bgr[y].min(axis=-1) < 128).any())
+
+class _BandMasker:
+    def __init__(self):
+        self.history: List[Tuple[List, List]] = []
+        self.masked: List[int] = []
+
+    def _repeated(self, sig: List, edge: int) -> int:
+        """Strips from the edge that match an earlier page, up to the last inked one."""
+        best = 0
+        for prev in self.history:
+            inked = 0
+            for n, (cur, old) in enumerate(zip(sig, prev[edge]), 1):
+                if not _sig_match(cur, old):
+                    break
+                if not cur[0]:
+                    inked = n
+            best = max(best, inked)
+        return best
+
+    @staticmethod
+    def _sigs(bgr: np.ndarray, sh: int, dy: int) -> Tuple[List, List]:
+        h = bgr.shape[0]
+        top = [_strip_sig(bgr[max(0, i * sh + dy):(i + 1) * sh + dy]) for i in range(_BAND_TOP)]
+        bottom = [_strip_sig(bgr[h - (i + 1) * sh + dy:min(h, h - i * sh + dy)]) for i in range(_BAND_BOTTOM)]
+        return top, bottom
+
+    def apply(self, bgr: np.ndarray, page_number: int) -> Tuple[int, int]:
+        """Blank repeated bands of bgr in place; returns the rows kept, [top, bottom)."""
+        h = bgr.shape[0]
+        sh = max(1, int(h * _BAND_STRIP))
+        step = max(1, int(h * _BAND_MAX_SHIFT) // 4)
+        base = self._sigs(bgr, sh, 0)
+        top = bottom = (0, 0)  # (strips, offset) of the best match at each edge
+        if self.history:
+            for dy in sorted((k * step for k in range(-4, 5)), key=abs):
+                sig = base if dy == 0 else self._sigs(bgr, sh, dy)
+                top = max(top, (self._repeated(sig[0], 0), dy), key=lambda m: m[0])
+                bottom = max(bottom, (self._repeated(sig[1], 1), dy), key=lambda m: m[0])
+        self.history = (self.history + [base])[-_BAND_HISTORY:]
+        # move each cut out of any glyph it would slice, toward the page edge
+        y0, y1 = 0, h
+        if top[0]:
+            y0 = max(0, top[0] * sh + top[1])
+            while 0 < y0 < h and _ink_row(bgr, y0 - 1) and _ink_row(bgr, y0):
+                y0 -= 1
+            bgr[:y0] = 255
+        if bottom[0]:
+            y1 = min(h, h - bottom[0] * sh + bottom[1])
+            while 0 < y1 < h and _ink_row(bgr, y1 - 1) and _ink_row(bgr, y1):
+                y1 += 1
+            bgr[y1:] = 255
+        if top[0] or bottom[0]:
+            self.masked.append(page_number)
+        return y0, y1
+
+def _mask_bands(ocr: Dict[str, Any], bgr: np.ndarray, page_number: int) -> Optional[Tuple[int, int]]:
+    """The rows left unmasked, or None when band masking is off for this document."""
+    if ocr.get("bands") is not None:
+        return ocr["bands"].apply(bgr, page_number)
+    return None
+
+# -------------- two-pass OCR --------------
+
+# Fast pass at FAST_OCR_DPI with light preprocessing; only lines whose mean word
+# confidence is below ESCALATE_CONF are re-rendered and re-OCRed the expensive way.
+# A page the fast pass mostly missed (under ESCALATE_MIN_WORDS words, or a mean word
+# confidence below ESCALATE_CONF) is escalated whole: there are no lines to crop.
+OCR_TWO_PASS = os.getenv("OCR_TWO_PASS", "0") == "1"
+FAST_OCR_DPI = 150
+ESCALATE_CONF = float(os.getenv("OCR_ESCALATE_CONF", "70"))
+ESCALATE_MIN_WORDS = int(os.getenv("OCR_ESCALATE_MIN_WORDS", "5"))
+_ESCALATE_PAD = 6  # fast-pass pixels around an escalated region
+
+def _light_preprocess(bgr: np.ndarray) -> np.ndarray:
+    gray = cv2.cvtColor(bgr, cv2.COLOR_BGR2GRAY)
+    _, thr = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+    return thr
+
+def _data_lines(data: Dict[str, List]) -> List[Dict[str, Any]]:
+    lines: List[Dict[str, Any]] = []
+    for i, word in enumerate(data["text"]):
+        if int(data["level"][i]) != 5 or not word.strip():
+            continue
+        key = (data["block_num"][i], data["par_num"][i], data["line_num"][i])
+        x0, y0 = data["left"][i], data["top"][i]
+        x1, y1 = x0 + data["width"][i], y0 + data["height"][i]
+        if lines and lines[-1]["key"] == key:
+            ln = lines[-1]
+            ln["rows"].append(i)
+            ln["box"] = [min(ln["box"][0], x0), min(ln["box"][1], y0), max(ln["box"][2], x1), max(ln["box"][3], y1)]
+        else:
+            lines.append({"key": key, "rows": [i], "box": [x0, y0, x1, y1]})
+    for ln in lines:
+        confs = [float(data["conf"][i]) for i in ln["rows"]]
+        ln["conf"] = sum(confs) / len(confs)
+    return lines
+
+def _escalation_regions(lines: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Merge consecutive low-confidence lines of the same block into one region."""
+    regions: List[Dict[str, Any]] = []
+    for i, ln in enumerate(lines):
+        if ln["conf"] >= ESCALATE_CONF:
+            continue
+        r = regions[-1] if regions else None
+        if r and r["last"] == i - 1 and r["block"] == ln["key"][0]:
+            r["last"] = i
+            b = r["box"]
+            r["box"] = [min(b[0], ln["box"][0]), min(b[1], ln["box"][1]), max(b[2], ln["box"][2]), max(b[3], ln["box"][3])]
+        else:
+            regions.append({"first": i, "last": i, "block": ln["key"][0], "box": list(ln["box"])})
+    return regions
+
+def _two_pass_ocr(fast_bgr: np.ndarray, get_full, scale: float, lang: str,
+                  words: Optional[WordTable] = None, page: int = 0, unit: float = 1.0,
+                  profile: Optional[Dict[str, Any]] = None) -> Tuple[str, int, int]:
+    """OCR fast_bgr cheaply, then re-OCR low-confidence regions, or the whole page when
+    the fast pass read little or badly, from the full-resolution raster returned by
+    get_full() (rendered at most once). scale is full-res pixels per
+    fast pixel, unit is output word-box units per fast pixel.
+    Returns (text, escalated fast-pass pixels, total fast-pass pixels)."""
+    p = profile or PROFILES["balanced"]
+    fast = _light_preprocess(fast_bgr)
+    data = pytesseract.image_to_data(Image.fromarray(fast), lang=lang, config=f"--oem {p['oem']} --psm 3",
+                                     output_type=pytesseract.Output.DICT)
+    lines = _data_lines(data)
+    h, w = fast.shape[:2]
+    n_words = sum(len(ln["rows"]) for ln in lines)
+    mean_conf = sum(ln["conf"] * len(ln["rows"]) for ln in lines) / n_words if n_words else 0.0
+    if n_words < ESCALATE_MIN_WORDS or mean_conf < ESCALATE_CONF:
+        text, rdata, _ = _ocr_layout(_preprocess_bgr_for_ocr(get_full(), profile=p), lang, words is not None, p)
+        if words is not None and rdata is not None:
+            words.add_tesseract_data(page, rdata, unit / scale / p["upscale"])
+        return text, h * w, h * w
+    regions = {r["first"]: r for r in _escalation_regions(lines)}
+    covered = {i for r in regions.values() for i in range(r["first"], r["last"] + 1)}
+
+    full = None
+    escalated = 0
+    out: List[str] = []
+    prev_par = None
+    for i, ln in enumerate(lines):
+        if i in covered and i not in regions:
+            continue
+        if prev_par is not None and ln["key"][:2] != prev_par:
+            out.append("")  # paragraph break
+        prev_par = ln["key"][:2]
+        if i not in regions:
+            out.append(" ".join(data["text"][j].strip() for j in ln["rows"]))
+            if words is not None:
+                words.add_tesseract_data(page, data, unit, rows=ln["rows"])
+            continue
+        if full is None:
+            full = get_full()
+        x0, y0, x1, y1 = regions[i]["box"]
+        x0, y0 = max(0, x0 - _ESCALATE_PAD), max(0, y0 - _ESCALATE_PAD)
+        x1, y1 = min(w, x1 + _ESCALATE_PAD), min(h, y1 + _ESCALATE_PAD)
+        escalated += (x1 - x0) * (y1 - y0)
+        fx0, fy0 = int(x0 * scale), int(y0 * scale)
+        crop = full[fy0:int(y1 * scale), fx0:int(x1 * scale)]
+        text, rdata = _ocr_array_data(_preprocess_bgr_for_ocr(crop, profile=p), lang,
+                                      config=f"--oem {p['oem']} --psm 6")
+        out.append(text)
+        if words is not None:
+            # region pixels are full-res and upscaled by preprocessing
+            words.add_tesseract_data(page, rdata, unit / scale / p["upscale"], offset=(x0 * unit, y0 * unit))
+    return "\n".join(out), escalated, h * w
+
+def _two_pass_meta(ocr: Dict[str, Any]) -> Dict[str, Any]:
+    if not ocr.get("two_pass"):
+        return {}
+    total = ocr.get("px_total", 0)
+    return {"ocr_mode": "two_pass",
+            "escalated_pixel_fraction": round(ocr.get("px_escalated", 0) / total, 4) if total else 0.0}
+
 # -------------- extractors --------------
 
-def extract_pdf(path: str, lang: str) -> Tuple[str, Dict[str, Any], List[str]]:
+def _bgr_page(path: str, page_number: int, dpi: int) -> Optional[np.ndarray]:
+    img = _render_page(path, page_number, dpi)
+    if img is None:
+        return None
+    try:
+        return cv2.cvtColor(np.array(img), cv2.COLOR_RGB2BGR)
+    finally:
+        img.close()
+
+# Settings that change the preprocessed pixels; the rest of a profile only steers OCR.
+_PREPROCESS_SETTINGS = ("denoise", "adaptive", "upscale")
+
+def _doc_hash(ocr: Dict[str, Any]) -> str:
+    if not ocr.get("doc_hash"):
+        ocr["doc_hash"] = _file_digest(ocr["path"])
+    return ocr["doc_hash"]
+
+def _cache_hit(ocr: Dict[str, Any], kind: str) -> None:
+    hits = ocr.setdefault("raster_hits", {"bgr": 0, "proc": 0})
+    hits[kind] += 1
+
+def _page_bgr(ocr: Dict[str, Any], page_number: int, dpi: int) -> Optional[np.ndarray]:
+    """Writable BGR raster of a PDF page, read back from the raster cache when this
+    document was rendered at dpi before (a retry with another lang or profile)."""
+    if not raster_cache.enabled():
+        return _bgr_page(ocr["path"], page_number, dpi)
+    key = raster_cache.key(_doc_hash(ocr), page_number, dpi, "bgr")
+    hit = raster_cache.get(key)
+    if hit is not None:
+        _cache_hit(ocr, "bgr")
+        return np.array(hit)  # private copy: band masking paints over it
+    bgr = _bgr_page(ocr["path"], page_number, dpi)
+    if bgr is not None:
+        raster_cache.put(key, bgr)
+    return bgr
+
+def _proc_key(ocr: Dict[str, Any], page_number: int, p: Dict[str, Any],
+              kept: Optional[Tuple[int, int]]) -> Optional[str]:
+    if not raster_cache.enabled():
+        return None
+    return raster_cache.key(_doc_hash(ocr), page_number, p["dpi"], "proc", kept=kept,
+                            **{k: p[k] for k in _PREPROCESS_SETTINGS})
+
+def _preprocess_cached(ocr: Dict[str, Any], bgr: np.ndarray, key: Optional[str], p: Dict[str, Any]) -> np.ndarray:
+    hit = raster_cache.get(key) if key else None
+    if hit is not None:
+        _cache_hit(ocr, "proc")
+        return hit  # read-only memory map; OCR never writes to it
+    proc = _preprocess_bgr_for_ocr(bgr, profile=p)
+    if key:
+        raster_cache.put(key, proc)
+    return proc
+
+def _raster_meta(ocr: Dict[str, Any]) -> Dict[str, Any]:
+    return {"raster_cache_hits": ocr["raster_hits"]} if ocr.get("raster_hits") else {}
+
+def _ocr_pdf_page_two_pass(path: str, page_number: int, ocr: Dict[str, Any],
+                           words: Optional[WordTable]) -> str:
+    fast = _page_bgr(ocr, page_number, FAST_OCR_DPI)
+    if fast is None:
+        return "\n"
+    _mask_bands(ocr, fast, page_number)
+    lang = _ocr_lang(ocr, _light_preprocess(fast)) if ocr["lang"] == "auto" else ocr["lang"]
+    p = ocr.get("profile") or PROFILES["balanced"]
+    text, escalated, total = _two_pass_ocr(
+        fast, lambda: _page_bgr(ocr, page_number, p["dpi"]), p["dpi"] / FAST_OCR_DPI, lang,
+        words, page_number - 1, 72 / FAST_OCR_DPI, p)
+    ocr["px_escalated"] = ocr.get("px_escalated", 0) + escalated
+    ocr["px_total"] = ocr.get("px_total", 0) + total
+    return text
+
+def _ocr_pdf_page(path: str, page_number: int, ocr: Dict[str, Any],
+                  words: Optional[WordTable] = None) -> str:
+    if ocr.get("two_pass"):
+        return _ocr_pdf_page_two_pass(path, page_number, ocr, words)
+    p = ocr.get("profile") or PROFILES["balanced"]
+    bgr = _page_bgr(ocr, page_number, p["dpi"])
+    if bgr is None:
+        return "\n"
+    kept = _mask_bands(ocr, bgr, page_number)
+    proc = _preprocess_cached(ocr, bgr, _proc_key(ocr, page_number, p, kept), p)
+    del bgr
+    lang = _ocr_lang(ocr, proc)
+    text, data, mode = _ocr_layout(proc, lang, words is not None, p)
+    ocr.setdefault("psm_modes", {})[page_number] = mode
+    if data is not None:
+        words.add_tesseract_data(page_number - 1, data, 72 / _proc_dpi(p))
+    return text
+
+# -------------- OCR page runners --------------
+
+# Worker processes for the render -> preprocess -> OCR page pipeline; 0 runs pages inline.
+OCR_WORKERS = int(os.getenv("OCR_WORKERS", "0"))
+
+class _InlineOcr:
+    """Renders, preprocesses and OCRs each page as it is submitted."""
+    workers = 0
+
+    def __init__(self, path: str, ocr: Dict[str, Any], words: Optional[WordTable], skip_blank: bool = False):
+        self.path = path
+        self.ocr = ocr
+        self.words = words
+        self.skip_blank = skip_blank
+        self.results: Dict[int, str] = {}
+        self.errors: Dict[int, Exception] = {}
+        self.skipped: List[int] = []
+        self.probe_seconds = 0.0
+
+    def _skip(self, index: int, page_number: int) -> bool:
+        """Low-dpi probe before the full render; blank pages are never OCRed."""
+        if not self.skip_blank:
+            return False
+        t0 = time.perf_counter()
+        try:
+            blank = _page_is_blank(self.path, page_number)
+        except Exception:
+            return False
+        finally:
+            self.probe_seconds += time.perf_counter() - t0
+        if blank:
+            self.skipped.append(index)
+        return blank
+
+    def submit(self, index: int, page_number: int) -> None:
+        if self._skip(index, page_number):
+            return
+        self._run(index, page_number)
+
+    def _run(self, index: int, page_number: int) -> None:
+        try:
+            self.results[index] = _ocr_pdf_page(self.path, page_number, self.ocr, self.words)
+        except Exception as e:
+            self.errors[index] = e
+
+    def done_chars(self) -> int:
+        """Characters of OCR text available so far, for the max_chars budget."""
+        return sum(len(t) for t in self.results.values())
+
+    def finish(self) -> None:
+        pass
+
+    def close(self) -> None:
+        pass
+
+def _ocr_shm_task(name: str, shape: Tuple[int, ...], lang: str, want_data: bool, profile: Dict[str, Any],
+                  proc_key: Optional[str] = None):
+    """(text, data, psm mode, preprocessed raster came from the cache)"""
+    shm = shared_memory.SharedMemory(name=name)
+    bgr = proc = None
+    error = None
+    try:
+        proc = raster_cache.get(proc_key) if proc_key else None
+        hit = proc is not None
+        if not hit:
+            bgr = np.ndarray(shape, np.uint8, buffer=shm.buf)
+            proc = _preprocess_bgr_for_ocr(bgr, out=shm.buf, profile=profile)  # in place over the raster
+            if proc_key:
+                raster_cache.put(proc_key, proc)
+        return (*_ocr_layout(proc, lang, want_data, profile), hit)
+    except Exception as e:
+        # keep only the message: the traceback's frames still hold views of the block
+        error = f"{type(e).__name__}: {e}"
+    finally:
+        bgr = proc = None  # views must go before the block is closed
+        shm.close()
+    raise RuntimeError(error)
+
+_ocr_pool = None
+_ocr_pool_lock = threading.Lock()
+
+def _ocr_executor(workers: int, broken: Optional[ProcessPoolExecutor] = None) -> ProcessPoolExecutor:
+    """The shared OCR pool; passing the pool a BrokenProcessPool came from replaces it
+    (once, however many pipelines saw it die)."""
+    global _ocr_pool
+    with _ocr_pool_lock:
+        if _ocr_pool is None or _ocr_pool._max_workers != workers or _ocr_pool is broken:
+            if _ocr_pool is not None:
+                _ocr_pool.shutdown(wait=False)
+            methods = mp.get_all_start_methods()
+            ctx = mp.get_context("forkserver" if "forkserver" in methods else "spawn")
+            _ocr_pool = ProcessPoolExecutor(max_workers=workers, mp_context=ctx)
+        return _ocr_pool
+
+class _OcrPipeline(_InlineOcr):
+    """Render in this process, preprocess + OCR in worker processes.
+
+    Rasters travel through a fixed pool of shared-memory blocks: render writes the page
+    into a free block, the worker preprocesses it in place and OCRs it, and only the
+    block name and shape cross the process boundary. The pool holds workers + 1
+    blocks, so rendering page N+1 overlaps OCR of page N and rendering blocks (the
+    backpressure) once every block is in flight."""
+
+    def __init__(self, path: str, ocr: Dict[str, Any], words: Optional[WordTable], skip_blank: bool,
+                 workers: int):
+        super().__init__(path, ocr, words, skip_blank)
+        self.workers = workers
+        self.profile = ocr.get("profile") or PROFILES["balanced"]
+        self.executor = _ocr_executor(workers)
+        self.free: "queue.Queue[shared_memory.SharedMemory]" = queue.Queue()
+        self.blocks: List[shared_memory.SharedMemory] = []
+        self.size = workers + 1
+        self.pending: Dict[int, Tuple[Any, int, Optional[Tuple[int, int]]]] = {}
+
+    def _block(self, nbytes: int) -> shared_memory.SharedMemory:
+        if len(self.blocks) < self.size and self.free.empty():
+            block = shared_memory.SharedMemory(create=True, size=nbytes)
+            self.blocks.append(block)
+            return block
+        block = self.free.get()  # backpressure: wait for a worker to hand a block back
+        if block.size < nbytes:
+            self.blocks.remove(block)
+            block.close()
+            block.unlink()
+            block = shared_memory.SharedMemory(create=True, size=nbytes)
+            self.blocks.append(block)
+        return block
+
+    def submit(self, index: int, page_number: int) -> None:
+        if self._skip(index, page_number):
+            return
+        if self.ocr["lang"] == "auto" and "detected" not in self.ocr:
+            return self._run(index, page_number)  # detect the language once, in-process
+        self._dispatch(index, page_number)
+
+    def _dispatch(self, index: int, page_number: int, kept=False) -> Optional[Any]:
+        """Render the page into a block and hand it to the pool. kept is the band mask
+        already chosen for the page when it is sent again (the history saw it once)."""
+        try:
+            src = _page_bgr(self.ocr, page_number, self.profile["dpi"])
+        except Exception as e:
+            self.errors[index] = e
+            return None
+        if src is None:
+            self.results[index] = "\n"
+            return None
+        h, w = src.shape[:2]
+        # room for the BGR raster and for the upscaled grayscale written over it
+        uh, uw = _upscaled_shape(h, w, self.profile)
+        block = self._block(max(h * w * 3, uh * uw))
+        bgr = np.ndarray((h, w, 3), np.uint8, buffer=block.buf)
+        np.copyto(bgr, src)
+        del src
+        if kept is False:
+            kept = _mask_bands(self.ocr, bgr, page_number)
+        elif kept is not None:
+            bgr[:kept[0]] = 255
+            bgr[kept[1]:] = 255
+        del bgr
+        args = (_ocr_shm_task, block.name, (h, w, 3), _ocr_lang(self.ocr, None), self.words is not None,
+                self.profile, _proc_key(self.ocr, page_number, self.profile, kept))
+        try:
+            try:
+                fut = self.executor.submit(*args)
+            except BrokenProcessPool:  # died under an earlier document
+                self.executor = _ocr_executor(self.workers, broken=self.executor)
+                fut = self.executor.submit(*args)
+        except Exception as e:
+            self.free.put(block)
+            self.errors[index] = e
+            return None
+        fut.add_done_callback(lambda _f, b=block: self.free.put(b))
+        self.pending[index] = (fut, page_number, kept)
+        return fut
+
+    def done_chars(self) -> int:
+        done = [f for f, _, _ in self.pending.values() if f.done() and not f.cancelled() and f.exception() is None]
+        return super().done_chars() + sum(len(f.result()[0]) for f in done)
+
+    def _retry_alone(self, index: int, page_number: int, kept) -> Tuple[Any, ...]:
+        """A worker died (segfault, OOM kill) and failed every page in flight with it.
+        Each is sent again on a fresh pool and awaited on its own, so only the page
+        that kills a worker again fails."""
+        self.executor = _ocr_executor(self.workers, broken=self.executor)
+        fut = self._dispatch(index, page_number, kept)
+        if fut is None:
+            return None
+        try:
+            return fut.result()
+        except BrokenProcessPool:
+            self.executor = _ocr_executor(self.workers, broken=self.executor)
+            raise RuntimeError(f"OCR worker died on page {page_number}") from None
+
+    def finish(self) -> None:
+        for index, (fut, page_number, kept) in list(self.pending.items()):
+            try:
+                try:
+                    out = fut.result()
+                except BrokenProcessPool:
+                    out = self._retry_alone(index, page_number, kept)
+                    if out is None:
+                        continue  # rendering failed this time; _dispatch recorded it
+                text, data, mode, hit = out
+            except Exception as e:
+                self.errors[index] = e
+                continue
+            if hit:
+                _cache_hit(self.ocr, "proc")
+            self.results[index] = text
+            self.ocr.setdefault("psm_modes", {})[page_number] = mode
+            if data is not None:
+                self.words.add_tesseract_data(page_number - 1, data, 72 / _proc_dpi(self.profile))
+        self.pending.clear()
+
+    def close(self) -> None:
+        for fut, _, _ in self.pending.values():
+            fut.cancel()
+        for fut, _, _ in self.pending.values():
+            try:
+                fut.result()
+            except BaseException:
+                pass
+        for block in self.blocks:
+            block.close()
+            block.unlink()
+        self.blocks.clear()
+
+def _ocr_runner(path: str, ocr: Dict[str, Any], words: Optional[WordTable], skip_blank: bool,
+                ocr_pages: int, workers: int) -> _InlineOcr:
+    # a sandbox child is daemonic and may not start processes of its own; two-pass
+    # pages render their own rasters on demand, so they always run inline
+    if workers > 0 and ocr_pages > 1 and not mp.current_process().daemon and not ocr.get("two_pass"):
+        return _OcrPipeline(path, ocr, words, skip_blank, workers)
+    return _InlineOcr(path, ocr, words, skip_blank)
+
+def _page_span(page_range, page_count: int) -> Tuple[int, int]:
+    """0-based [start, stop) for a 1-based inclusive (first, last) range, clamped."""
+    if not page_range:
+        return 0, page_count
+    first, last = page_range
+    start = min(page_count, max(1, first or 1) - 1)
+    stop = page_count if last is None else min(page_count, last)
+    return start, max(start, stop)
+
+def _truncate(text: str, max_chars: int) -> str:
+    cut = text[:max_chars]
+    if len(text) > max_chars and not text[max_chars].isspace() and " " in cut:
+        cut = cut.rsplit(" ", 1)[0]  # do not end on half a word
+    return cut.rstrip()
+
+def extract_pdf(path: str, lang: str, text_backend: Optional[str] = None,
+                low_memory: Optional[bool] = None,
+                doc_hash: Optional[str] = None, words: Optional[WordTable] = None,
+                ocr_workers: Optional[int] = None, skip_blank: Optional[bool] = None,
+                two_pass: Optional[bool] = None, page_range: Optional[Tuple[Optional[int], Optional[int]]] = None,
+                max_chars: Optional[int] = None, profile: Optional[str] = None) -> Tuple[str, Dict[str, Any], List[str]]:
+    """page_range: 1-based inclusive (first, last), either end None for open; pages
+    outside it are not even triaged. max_chars: stop once this much text is in hand and
+    cut the output to it; later pages are never rendered or OCRed. profile: a PROFILES
+    name for the OCR pipeline."""
     warnings: List[str] = []
-    pages: List[str] = []
-    used_ocr = 0
+    fallback_pages = 0
+    rss: Dict[str, float] = {}
+    timings = {"triage": 0.0, "text": 0.0, "ocr": 0.0}
+    profile, settings = _profile(profile)
+    ocr = {"lang": lang, "path": path, "doc_hash": doc_hash, "profile": settings,
+           "two_pass": OCR_TWO_PASS if two_pass is None else two_pass}
 
     with pdfplumber.open(path) as pdf:
-        for page in pdf.pages:
-            txt = None
-            try:
-                txt = page.extract_text(x_tolerance=2, y_tolerance=2, keep_blank_chars=False)
-            except Exception:
+        page_count = len(pdf.pages)
+        start, stop = _page_span(page_range, page_count)
+        selected = pdf.pages[start:stop]
+        if low_memory is None:
+            low_memory = len(selected) >= LOW_MEMORY_PAGES
+        triage = []
+        t0 = time.perf_counter()
+        for page in selected:
+            triage.append(_triage_page(page))
+            if low_memory:
+                _release_page(pdf, page)
+            _note_rss(rss, "triage")
+        timings["triage"] = time.perf_counter() - t0
+        plan = [_PAGE_PLAN[t["class"]] for t in triage]
+        if MASK_REPEATED_BANDS and len(plan) - plan.count("text") > 1:
+            ocr["bands"] = _BandMasker()
+        backend = _open_text_backend(text_backend, path, pdf)
+        layout = backend if isinstance(backend, PlumberTextBackend) else PlumberTextBackend(path, pdf)
+        texts: List[Optional[str]] = [None] * len(plan)
+        ocr_submitted = 0
+        processed = 0
+        text_chars = 0
+        budget_hit = False
+        runner = _ocr_runner(path, ocr, words, SKIP_BLANK_PAGES if skip_blank is None else skip_blank,
+                             plan.count("ocr"), OCR_WORKERS if ocr_workers is None else ocr_workers)
+
+        try:
+            for index, (page, method) in enumerate(zip(selected, plan)):
+                t0 = time.perf_counter()
                 txt = None
+                if method != "ocr":
+                    txt = _safe_page_text(backend, start + index)
+                    if method == "text" and backend is not layout:
+                        if backend.multi_column(start + index) and triage[index]["rulings"] < _TABLE_RULINGS:
+                            # side-by-side columns: read each on its own
+                            txt = _safe_page_text(layout, start + index, columns=True)
+                            fallback_pages += 1
+                        elif not _text_layer_ok(txt) or backend.multi_column(start + index):
+                            # fast layer came back empty or garbled, or a ruled table whose
+                            # cells need pdfplumber's row-by-row reading order
+                            txt = _safe_page_text(layout, start + index)
+                            fallback_pages += 1
+                    if method == "text_or_ocr" and not _text_layer_ok(txt):
+                        txt = None
 
-            if txt and txt.strip():
-                pages.append(txt)
-            else:
-                try:
-                    images = convert_from_path(
-                        path, dpi=300,
-                        first_page=page.page_number, last_page=page.page_number,
-                        poppler_path=POPPLLER_PATH if (POPPLER_PATH := os.getenv("POPPLER_PATH")) else None
-                    )
-                    if images:
-                        bgr = cv2.cvtColor(np.array(images[0]), cv2.COLOR_RGB2BGR)
-                        proc = _preprocess_bgr_for_ocr(bgr)
-                        ocr = _ocr_array(proc, lang)
-                        pages.append(ocr)
-                        used_ocr += 1
-                    else:
-                        pages.append("\n")
-                except Exception as e:
-                    warnings.append(f"OCR failed on page {page.page_number}: {e}")
-                    pages.append("\n")
+                if txt and txt.strip():
+                    texts[index] = txt
+                    text_chars += len(txt)
+                    stage = "text"
+                    if words is not None:
+                        words.add_plumber_words(page.page_number - 1,
+                                                page.extract_words(x_tolerance=2, y_tolerance=2))
+                else:
+                    stage = "ocr"
+                    ocr_submitted += 1
+                    runner.submit(index, page.page_number)
+                if low_memory:
+                    _release_page(pdf, page)
+                timings[stage] += time.perf_counter() - t0
+                _note_rss(rss, stage)
+                processed = index + 1
+                if max_chars and text_chars + runner.done_chars() >= max_chars:
+                    budget_hit = processed < len(selected)
+                    break
+
+            if ocr_submitted:
+                t0 = time.perf_counter()
+                runner.finish()
+                timings["ocr"] += time.perf_counter() - t0
+                _note_rss(rss, "ocr")
+        finally:
+            backend.close()
+            runner.close()
+    # probes ran inside the ocr stage; kept apart so ocr covers OCRed pages only
+    timings["blank_probe"] = runner.probe_seconds
+    timings["ocr"] = max(0.0, timings["ocr"] - runner.probe_seconds)
+
+    for index, e in sorted(runner.errors.items()):
+        warnings.append(f"OCR failed on page {start + index + 1}: {e}")
+    for index, text in runner.results.items():
+        texts[index] = text
+    used_ocr = len(runner.results)
+    pages = [t if t is not None else "\n" for t in texts[:processed]]
 
     pages = _strip_headers_footers(pages)
     merged = _normalize("\n\n".join(pages))
-    meta = {"detected_type": "pdf", "page_count": len(pages), "used_ocr_pages": used_ocr}
+    truncated = bool(max_chars) and len(merged) > max_chars
+    if truncated:
+        merged = _truncate(merged, max_chars)
+    _note_rss(rss, "postprocess")
+    counts = {k: sum(t["class"] == k for t in triage) for k in _PAGE_PLAN}
+    for index, t in enumerate(triage):
+        if t["error"]:
+            warnings.append(f"Triage failed on page {start + index + 1}, treated as mixed: {t['error']}")
+    meta = {"detected_type": "pdf", "page_count": page_count, "pages_processed": processed,
+            "used_ocr_pages": used_ocr,
+            "triage": counts, "page_classes": [t["class"] for t in triage],
+            "triage_failed_pages": sum(t["error"] is not None for t in triage),
+            "text_backend": backend.name, "text_backend_fallback_pages": fallback_pages,
+            "low_memory": low_memory, "peak_rss_mb": rss, "max_rss_mb": _max_rss_mb(),
+            "timings": {k: round(v, 3) for k, v in timings.items()}, "ocr_workers": runner.workers,
+            "blank_pages_skipped": len(runner.skipped), "ocr_failed_pages": len(runner.errors),
+            **(_lang_meta(ocr) if used_ocr else {}), **(_two_pass_meta(ocr) if used_ocr else {}),
+            **_psm_meta(ocr, range(start + 1, start + processed + 1)), **_raster_meta(ocr)}
+    if used_ocr:
+        meta["profile"] = profile
+    if used_ocr and ocr.get("bands") is not None:
+        meta["band_masked_pages"] = ocr["bands"].masked
+    if page_range:
+        if selected:
+            meta["page_range"] = [start + 1, stop]
+        else:
+            meta["page_range"] = list(page_range)  # clamped it would read backwards, e.g. [6, 5]
+            warnings.append(f"Page range selects none of the {page_count} page(s).")
+    if max_chars:
+        meta.update(max_chars=max_chars, char_budget_reached=budget_hit, truncated=truncated)
     if used_ocr:
         warnings.append(f"Used OCR on {used_ocr} page(s).")
     return merged, meta, warnings
@@ -168,13 +1523,42 @@ def extract_odt(path: str) -> Tuple[str, Dict[str, Any], List[str]]:
     except Exception as e:
         return "", {"detected_type": "odt"}, [f"ODT parse error: {e}"]
 
-def extract_image(path: str, lang: str) -> Tuple[str, Dict[str, Any], List[str]]:
+def extract_image(path: str, lang: str, doc_hash: Optional[str] = None, words: Optional[WordTable] = None,
+                  two_pass: Optional[bool] = None, profile: Optional[str] = None,
+                  skip_blank: Optional[bool] = None) -> Tuple[str, Dict[str, Any], List[str]]:
+    profile, settings = _profile(profile)
+    settings = dict(settings, dpi=300)  # images are taken to be 300 dpi scans, as for the blank probe
     bgr = cv2.imread(path)
     if bgr is None:
         return "", {"detected_type": "image"}, ["Could not read image"]
-    proc = _preprocess_bgr_for_ocr(bgr)
-    text = _ocr_array(proc, lang)
-    return _normalize(text), {"detected_type": "image"}, []
+    h, w = bgr.shape[:2]
+    if SKIP_BLANK_PAGES if skip_blank is None else skip_blank:
+        gray = cv2.cvtColor(bgr, cv2.COLOR_BGR2GRAY)
+        f = min(1.0, BLANK_PROBE_DPI / 300)
+        if _is_blank(cv2.resize(gray, None, fx=f, fy=f, interpolation=cv2.INTER_AREA)):
+            return "", {"detected_type": "image", "width": w, "height": h, "blank_pages_skipped": 1}, \
+                ["Image looks blank; OCR skipped."]
+    ocr = {"lang": lang, "path": path, "doc_hash": doc_hash, "profile": settings,
+           "two_pass": OCR_TWO_PASS if two_pass is None else two_pass}
+    if ocr["two_pass"]:
+        # pass 1 at half resolution; escalated regions are cropped from the original
+        f = min(1.0, FAST_OCR_DPI / 300)
+        fast = cv2.resize(bgr, None, fx=f, fy=f, interpolation=cv2.INTER_AREA)
+        lang = _ocr_lang(ocr, _light_preprocess(fast))
+        text, ocr["px_escalated"], ocr["px_total"] = _two_pass_ocr(
+            fast, lambda: bgr, 1 / f, lang, words, 0, 1 / f, settings)
+        meta = {"detected_type": "image", "width": w, "height": h, "profile": profile,
+                **_lang_meta(ocr), **_two_pass_meta(ocr)}
+        return _normalize(text), meta, []
+    # an image is its own render; only the preprocessed raster is worth caching
+    proc = _preprocess_cached(ocr, bgr, _proc_key(ocr, 1, settings, None), settings)
+    lang = _ocr_lang(ocr, proc)
+    text, data, mode = _ocr_layout(proc, lang, words is not None, settings)
+    if data is not None:
+        words.add_tesseract_data(0, data, 1 / settings["upscale"])  # back to source pixels
+    meta = {"detected_type": "image", "width": w, "height": h, "profile": profile, "psm_modes": [mode],
+            **_lang_meta(ocr), **_raster_meta(ocr)}
+    return _normalize(text), meta, []
 
 def extract_txt(path: str) -> Tuple[str, Dict[str, Any], List[str]]:
     try:
@@ -197,27 +1581,242 @@ def extract_rtf_naive(path: str) -> Tuple[str, Dict[str, Any], List[str]]:
 
 SUPPORTED = {".pdf", ".docx", ".odt", ".png", ".jpg", ".jpeg", ".txt", ".rtf"}
 
-def extract_any(path: str, lang: str = "eng") -> Dict[str, Any]:
+_EXT_TYPES = {".pdf": "pdf", ".docx": "docx", ".odt": "odt", ".png": "image", ".jpg": "image",
+              ".jpeg": "image", ".txt": "txt", ".rtf": "rtf"}
+
+def _sniff_zip(path: str) -> Optional[str]:
+    try:
+        with zipfile.ZipFile(path) as zf:
+            names = set(zf.namelist())
+            if "word/document.xml" in names:
+                return "docx"
+            if "mimetype" in names and zf.read("mimetype").strip() == b"application/vnd.oasis.opendocument.text":
+                return "odt"
+    except Exception:
+        pass
+    return None
+
+def _sniff_type(path: str) -> Optional[str]:
+    """Detect the document type from magic bytes; None if the content is not recognised."""
+    try:
+        with open(path, "rb") as fh:
+            head = fh.read(4096)
+    except OSError:
+        return None
+    if b"%PDF-" in head[:1024]:
+        return "pdf"
+    if head.startswith(b"\x89PNG\r\n\x1a\n") or head.startswith(b"\xff\xd8\xff"):
+        return "image"
+    if head.lstrip().startswith(b"{\\rtf"):
+        return "rtf"
+    if head.startswith(b"PK\x03\x04"):
+        return _sniff_zip(path)
+    if not head or b"\x00" in head:
+        return None
+    try:
+        head.decode("utf-8")
+    except UnicodeDecodeError as e:
+        if e.start < len(head) - 4:  # allow a multi-byte char cut at the read boundary
+            return None
+    return "txt"
+
+def extract_any(path: str, lang: str = "eng", text_backend: Optional[str] = None,
+                low_memory: Optional[bool] = None, doc_hash: Optional[str] = None,
+                structured: bool = False, ocr_workers: Optional[int] = None,
+                skip_blank: Optional[bool] = None, two_pass: Optional[bool] = None,
+                page_range: Optional[Tuple[Optional[int], Optional[int]]] = None,
+                max_chars: Optional[int] = None, profile: Optional[str] = None) -> Dict[str, Any]:
+    """Extract text from any supported file. With structured=True the result also
+    carries "words": a WordTable.to_dict() of positioned words (PDF and images only).
+    page_range and max_chars let PDFs stop early (see extract_pdf); other types are
+    only cut to max_chars. profile names the OCR settings (PROFILES, default
+    EXTRACT_PROFILE)."""
+    _profile(profile)  # unknown names fail for every file type, not only when they are used
+    if text_backend is not None and text_backend not in PDF_TEXT_BACKENDS:
+        raise ValueError(f"Unknown PDF text backend: {text_backend}")
+    if max_chars is not None and max_chars <= 0:
+        raise ValueError(f"max_chars must be positive, not {max_chars}")
     ext = os.path.splitext(path)[1].lower()
     text = ""
     meta: Dict[str, Any] = {}
     warnings: List[str] = []
 
-    if ext == ".pdf":
-        text, meta, w = extract_pdf(path, lang)
-    elif ext == ".docx":
+    kind = _sniff_type(path)
+    if kind and ext in _EXT_TYPES and _EXT_TYPES[ext] != kind:
+        warnings.append(f"File extension {ext} does not match its content; treated as {kind}.")
+    kind = kind or _EXT_TYPES.get(ext)
+    words = WordTable() if structured and kind in {"pdf", "image"} else None
+
+    t0 = time.perf_counter()
+    if kind == "pdf":
+        text, meta, w = extract_pdf(path, lang, text_backend=text_backend, low_memory=low_memory,
+                                    doc_hash=doc_hash, words=words, ocr_workers=ocr_workers,
+                                    skip_blank=skip_blank, two_pass=two_pass, page_range=page_range,
+                                    max_chars=max_chars, profile=profile)
+    elif kind == "docx":
         text, meta, w = extract_docx(path)
-    elif ext == ".odt":
+    elif kind == "odt":
         text, meta, w = extract_odt(path)
-    elif ext in {".png", ".jpg", ".jpeg"}:
-        text, meta, w = extract_image(path, lang)
-    elif ext == ".txt":
+    elif kind == "image":
+        text, meta, w = extract_image(path, lang, doc_hash=doc_hash, words=words, two_pass=two_pass,
+                                      profile=profile, skip_blank=skip_blank)
+    elif kind == "txt":
         text, meta, w = extract_txt(path)
-    elif ext == ".rtf":
+    elif kind == "rtf":
         text, meta, w = extract_rtf_naive(path)
     else:
         w = [f"Unsupported file type: {ext}"]
 
+    if kind:
+        _record_timings(kind, meta, time.perf_counter() - t0)
+    if max_chars and kind != "pdf" and len(text) > max_chars:
+        text = _truncate(text, max_chars)
+        meta["truncated"] = True
+
     warnings += w
     warnings += _quality(text)
-    return {"text": text, "meta": meta, "warnings": warnings}
+    res = {"text": text, "meta": meta, "warnings": warnings}
+    if words is not None:
+        res["words"] = words.to_dict()
+    return res
+
+# -------------- cost estimate --------------
+
+# Seconds per unit of work before any timings have been recorded on this host.
+STAGE_COSTS = {"triage_page": 0.005, "text_page": 0.05, "ocr_page": 3.0,
+               "docx": 0.1, "odt": 0.1, "txt": 0.01, "rtf": 0.01}
+
+# Share of mixed pages expected to fail the text-layer check and fall through to OCR.
+MIXED_OCR_SHARE = 0.5
+
+# An "ocr_page" is an A4 page rendered at 300 dpi; standalone images are scaled by pixel count.
+OCR_PAGE_MEGAPIXELS = 8.7
+
+# Recorded per-unit stage timings (EWMA), shared by all workers on the host. Empty disables
+# persistence. They steer /estimate, scheduling and Retry-After, so the file lives in a
+# private_dir and is only used from there; otherwise each process keeps its own.
+STAGE_TIMINGS_PATH = os.getenv("STAGE_TIMINGS_PATH",
+                               os.path.join(tempfile.gettempdir(), "inqous_state", "stage_timings.json"))
+_TIMING_ALPHA = 0.2
+_calibration: Dict[str, float] = {}
+
+def _timings_path() -> Optional[str]:
+    if not STAGE_TIMINGS_PATH:
+        return None
+    try:
+        private_dir(os.path.dirname(os.path.abspath(STAGE_TIMINGS_PATH)))
+    except OSError:
+        return None
+    return STAGE_TIMINGS_PATH
+
+def _read_calibration(path: Optional[str]) -> Dict[str, float]:
+    if path:
+        try:
+            with open(path) as fh:
+                return {k: float(v) for k, v in json.load(fh).items()}
+        except (OSError, ValueError, AttributeError):
+            pass
+    return dict(_calibration)
+
+def _load_calibration() -> Dict[str, float]:
+    return _read_calibration(_timings_path())
+
+def record_stage_timings(samples: Dict[str, Tuple[float, float]]) -> None:
+    """Fold (seconds, units) observations into the per-unit cost of each stage. The
+    file's read-modify-write holds an exclusive flock, so concurrent workers do not
+    drop each other's updates."""
+    path = _timings_path()
+    lock = None
+    if path and fcntl is not None:
+        lock = os.fdopen(os.open(path + ".lock", os.O_WRONLY | os.O_CREAT, 0o600), "w")
+        fcntl.flock(lock.fileno(), fcntl.LOCK_EX)  # released on close
+    try:
+        cal = _read_calibration(path)
+        for stage, (seconds, units) in samples.items():
+            if units <= 0:
+                continue
+            per_unit = seconds / units
+            prev = cal.get(stage)
+            cal[stage] = per_unit if prev is None else prev + _TIMING_ALPHA * (per_unit - prev)
+        _calibration.update(cal)
+        if path:
+            tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            try:
+                with os.fdopen(os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), "w") as fh:
+                    json.dump(cal, fh)
+                os.replace(tmp, path)
+            except OSError:
+                pass
+    finally:
+        if lock is not None:
+            lock.close()
+
+def stage_costs() -> Dict[str, float]:
+    return {**STAGE_COSTS, **_load_calibration()}
+
+def _record_timings(kind: str, meta: Dict[str, Any], elapsed: float) -> None:
+    # OCR time is kept in "balanced" units so every profile calibrates the same cost
+    ratio = _profile_cost_ratio(meta.get("profile")) if meta.get("profile") in PROFILES else 1.0
+    # a two-pass page costs a fast pass plus its escalations, not a page of any profile
+    profile_ocr = meta.get("ocr_mode") != "two_pass"
+    if kind == "pdf":
+        t = meta.get("timings", {})
+        ocr = meta.get("used_ocr_pages", 0) + meta.get("ocr_failed_pages", 0)
+        processed = meta.get("pages_processed", meta.get("page_count", 0))
+        # blank pages cost only their probe, which is left out of the ocr time as well
+        samples = {"triage_page": (t.get("triage", 0.0), len(meta.get("page_classes", []))),
+                   "text_page": (t.get("text", 0.0), processed - ocr - meta.get("blank_pages_skipped", 0))}
+        if profile_ocr:
+            samples["ocr_page"] = (t.get("ocr", 0.0) / ratio, ocr)
+    elif kind == "image":
+        if meta.get("blank_pages_skipped") or not profile_ocr:
+            return  # nothing was OCRed, or not at a profile's cost
+        megapixels = meta.get("width", 0) * meta.get("height", 0) / 1e6
+        samples = {"ocr_page": (elapsed / ratio, megapixels / OCR_PAGE_MEGAPIXELS)}
+    else:
+        samples = {kind: (elapsed, 1)}
+    try:
+        record_stage_timings(samples)
+    except Exception:
+        pass
+
+def estimate_cost(path: str, profile: Optional[str] = None) -> Dict[str, Any]:
+    """Cheap pre-extraction estimate: sniff, PDF triage and image headers only; no text
+    extraction or rendering. predicted_seconds uses the calibrated stage costs, with OCR
+    scaled to the given extraction profile."""
+    ext = os.path.splitext(path)[1].lower()
+    kind = _sniff_type(path) or _EXT_TYPES.get(ext)
+    costs = stage_costs()
+    costs["ocr_page"] *= _profile_cost_ratio(_profile(profile)[0])
+    est: Dict[str, Any] = {"detected_type": kind, "page_count": 1}
+    if kind == "pdf":
+        pages = []
+        with pdfplumber.open(path) as pdf:
+            for page in pdf.pages:
+                t = _triage_page(page)
+                width_in = float(page.width) / 72
+                dpi = round(t["image_px"][0] / width_in) if t["images"] and width_in else None
+                pages.append({"page": page.page_number, "class": t["class"], "path": _PAGE_PLAN[t["class"]],
+                              "image_coverage": t["image_coverage"], "image_dpi": dpi})
+                _release_page(pdf, page)
+        plan = {m: [p["page"] for p in pages if p["path"] == m] for m in _PAGE_PLAN.values()}
+        mixed = len(plan["text_or_ocr"])
+        est.update(page_count=len(pages), pages=pages, plan=plan)
+        seconds = (len(pages) * costs["triage_page"]
+                   + (len(plan["text"]) + mixed) * costs["text_page"]
+                   + (len(plan["ocr"]) + mixed * MIXED_OCR_SHARE) * costs["ocr_page"])
+    elif kind == "image":
+        try:
+            with Image.open(path) as img:
+                w, h = img.size
+                est.update(width=w, height=h, image_dpi=img.info.get("dpi"), format=img.format)
+            scale = w * h / 1e6 / OCR_PAGE_MEGAPIXELS
+        except Exception:
+            scale = 1.0
+        est["plan"] = {"ocr": [1]}
+        seconds = costs["ocr_page"] * scale
+    else:
+        est["plan"] = {"text": [1]}
+        seconds = costs.get(kind or "", 0.01)
+    est["predicted_seconds"] = round(seconds, 3)
+    return est
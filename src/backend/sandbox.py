@@ -0,0 +1,181 @@
+"""Run extract_any in recycled child processes with resource limits.
+
+Each child sets an address-space rlimit once and a per-job CPU rlimit before every
+extraction; the parent enforces a wall-clock timeout and kills the child if it is
+exceeded. Children are kept warm and reused for up to SANDBOX_MAX_TASKS jobs, so a
+request costs a pipe round-trip rather than a fork.
+
+A child's traceback is logged here and never leaves the server: SandboxError.to_dict(),
+which API responses carry, holds only the kind, exception type and message.
+"""
+import multiprocessing as mp
+import logging, os, queue, signal, threading, traceback
+from typing import Any, Dict, Optional
+
+try:
+    import resource
+except Exception:  # Windows: no rlimits, timeout and crash isolation still apply
+    resource = None
+
+SANDBOX_WORKERS = int(os.getenv("SANDBOX_WORKERS", str(os.cpu_count() or 2)))
+SANDBOX_MAX_TASKS = int(os.getenv("SANDBOX_MAX_TASKS", "50"))
+SANDBOX_MEMORY_MB = int(os.getenv("SANDBOX_MEMORY_MB", "2048"))
+SANDBOX_CPU_SECONDS = int(os.getenv("SANDBOX_CPU_SECONDS", "120"))
+SANDBOX_TIMEOUT = float(os.getenv("SANDBOX_TIMEOUT", "180"))
+
+_log = logging.getLogger(__name__)
+
+class SandboxError(Exception):
+    """An extraction that did not return normally; `kind` is one of
+    timeout, memory, cpu_limit, killed, crashed or error."""
+
+    _STATUS = {"timeout": 504, "cpu_limit": 504, "memory": 413}
+
+    def __init__(self, kind: str, message: str, **detail: Any):
+        super().__init__(message)
+        self.kind = kind
+        self.detail = detail
+
+    @property
+    def status(self) -> int:
+        return self._STATUS.get(self.kind, 500)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """What a client may see; the detail (exit codes, signals, limits) stays server-side."""
+        out = {"kind": self.kind, "message": str(self)}
+        if "type" in self.detail:
+            out["type"] = self.detail["type"]
+        return out
+
+def _set_cpu_budget(seconds: int) -> None:
+    # RLIMIT_CPU counts process lifetime, so move the soft limit forward per job.
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    _, hard = resource.getrlimit(resource.RLIMIT_CPU)
+    soft = int(usage.ru_utime + usage.ru_stime) + seconds
+    if hard != resource.RLIM_INFINITY:
+        soft = min(soft, hard)
+    resource.setrlimit(resource.RLIMIT_CPU, (soft, hard))
+
+def _child_main(conn, memory_mb: int, cpu_seconds: int) -> None:
+    if resource is not None and memory_mb > 0:
+        limit = memory_mb * 2**20
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+    from resume_extractor import extract_any
+
+    while True:
+        try:
+            job = conn.recv()
+        except (EOFError, OSError):
+            return
+        if job is None:
+            return
+        path, kwargs = job
+        if resource is not None and cpu_seconds > 0:
+            _set_cpu_budget(cpu_seconds)
+        try:
+            conn.send(("ok", extract_any(path, **kwargs)))
+        except BaseException as e:
+            msg = str(e)
+            oom = isinstance(e, MemoryError) or "Insufficient memory" in msg or "out of memory" in msg.lower()
+            conn.send(("error", {"kind": "memory" if oom else "error", "type": type(e).__name__,
+                                 "message": msg, "traceback": traceback.format_exc(limit=20)}))
+
+class _Worker:
+    def __init__(self, ctx, memory_mb: int, cpu_seconds: int):
+        self.conn, child_conn = ctx.Pipe()
+        self.proc = ctx.Process(target=_child_main, args=(child_conn, memory_mb, cpu_seconds), daemon=True)
+        self.proc.start()
+        child_conn.close()
+        self.tasks = 0
+
+    def alive(self) -> bool:
+        return self.proc.is_alive()
+
+    def stop(self, kill: bool = False) -> None:
+        try:
+            if kill:
+                self.proc.kill()
+            else:
+                self.conn.send(None)
+        except Exception:
+            pass
+        self.proc.join(timeout=2)
+        if self.proc.is_alive():
+            self.proc.kill()
+            self.proc.join(timeout=2)
+        self.conn.close()
+
+def _death_error(worker: _Worker) -> SandboxError:
+    worker.proc.join(timeout=2)
+    code = worker.proc.exitcode
+    sig = -code if code is not None and code < 0 else None
+    name = signal.Signals(sig).name if sig else None
+    if sig == getattr(signal, "SIGXCPU", None):
+        return SandboxError("cpu_limit", "Extraction exceeded its CPU time limit", exitcode=code, signal=name)
+    if sig == getattr(signal, "SIGKILL", None):
+        return SandboxError("killed", "Extraction process was killed", exitcode=code, signal=name)
+    return SandboxError("crashed", "Extraction process crashed", exitcode=code, signal=name)
+
+class SandboxPool:
+    def __init__(self, workers: int = SANDBOX_WORKERS, max_tasks: int = SANDBOX_MAX_TASKS,
+                 memory_mb: int = SANDBOX_MEMORY_MB, cpu_seconds: int = SANDBOX_CPU_SECONDS,
+                 timeout: float = SANDBOX_TIMEOUT):
+        methods = mp.get_all_start_methods()
+        self._ctx = mp.get_context("forkserver" if "forkserver" in methods else "spawn")
+        if "forkserver" in methods:
+            self._ctx.set_forkserver_preload(["resume_extractor"])
+        self.max_tasks = max_tasks
+        self.memory_mb = memory_mb
+        self.cpu_seconds = cpu_seconds
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(workers)
+        self._idle: "queue.LifoQueue[_Worker]" = queue.LifoQueue()
+
+    def _checkout(self) -> _Worker:
+        while True:
+            try:
+                worker = self._idle.get_nowait()
+            except queue.Empty:
+                return _Worker(self._ctx, self.memory_mb, self.cpu_seconds)
+            if worker.alive():
+                return worker
+            worker.stop(kill=True)
+
+    def run(self, path: str, timeout: Optional[float] = None, **kwargs: Any) -> Dict[str, Any]:
+        """Run extract_any(path, **kwargs) in a child; raises SandboxError on any failure."""
+        timeout = self.timeout if timeout is None else timeout
+        with self._slots:
+            worker = self._checkout()
+            done = reusable = False
+            try:
+                worker.conn.send((path, kwargs))
+                if not worker.conn.poll(timeout):
+                    raise SandboxError("timeout", f"Extraction exceeded {timeout:.0f}s", timeout=timeout)
+                try:
+                    status, payload = worker.conn.recv()
+                except (EOFError, OSError):
+                    raise _death_error(worker)
+                done = True
+                worker.tasks += 1
+                # a child that hit its memory limit may be left fragmented; replace it
+                reusable = worker.tasks < self.max_tasks and payload.get("kind") != "memory"
+            finally:
+                if reusable:
+                    self._idle.put(worker)
+                else:
+                    worker.stop(kill=not done)
+
+        if status == "ok":
+            return payload
+        kind = payload.pop("kind")
+        tb = payload.pop("traceback", None)
+        if tb:
+            _log.error("sandboxed extraction of %s failed (%s)\n%s", path, kind, tb.rstrip())
+        raise SandboxError(kind, payload.pop("message") or payload["type"], **payload)
+
+    def close(self) -> None:
+        while True:
+            try:
+                self._idle.get_nowait().stop()
+            except queue.Empty:
+                return
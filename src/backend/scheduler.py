@@ -0,0 +1,195 @@
+"""Cost-aware fair dispatch of extraction jobs.
+
+Jobs carry an estimated cost (predicted seconds, see resume_extractor.estimate_cost)
+and a user key. Small jobs are dispatched ahead of large ones, and one worker slot
+is kept free of large jobs so a long OCR bundle never blocks interactive uploads.
+Within each class users are served by virtual time (start-time fair queueing
+weighted by cost), so one user's backlog cannot crowd out everyone else. Any job
+that has waited longer than SCHED_MAX_WAIT is dispatched next regardless of class.
+
+Admission control works per class, mirroring dispatch. A small job waits only for
+the small backlog (queued small costs plus what is left of running small ones)
+spread over the slots no large job holds, so a long scan never gets a DOCX refused.
+A large job waits for the large backlog on the capped large slots, behind the small
+backlog. Above ADMIT_MAX_WAIT seconds submit() holds the caller for up to
+ADMIT_QUEUE_TIMEOUT seconds for the backlog to drain, then raises Overloaded with
+the seconds until it is expected to have drained (for Retry-After). An idle
+scheduler admits any job, however costly.
+"""
+import math, os, threading, time
+from collections import deque
+from concurrent.futures import Future
+from typing import Any, Callable, Deque, Dict, Optional, Set
+
+SCHED_WORKERS = int(os.getenv("SCHED_WORKERS", str(os.cpu_count() or 2)))
+SMALL_JOB_COST = float(os.getenv("SMALL_JOB_COST", "5"))
+SCHED_MAX_WAIT = float(os.getenv("SCHED_MAX_WAIT", "60"))
+ADMIT_MAX_WAIT = float(os.getenv("ADMIT_MAX_WAIT", "30"))            # <= 0 admits everything
+ADMIT_QUEUE_TIMEOUT = float(os.getenv("ADMIT_QUEUE_TIMEOUT", "0"))  # 0 sheds at once
+
+class Overloaded(Exception):
+    def __init__(self, retry_after: int, predicted_wait: float):
+        super().__init__(f"Server busy: about {predicted_wait:.0f}s of queued work; retry in {retry_after}s")
+        self.retry_after = retry_after
+        self.predicted_wait = predicted_wait
+
+class _Job:
+    __slots__ = ("user", "cost", "small", "fn", "args", "kwargs", "future", "enqueued", "started")
+
+    def __init__(self, user: str, cost: float, small: bool, fn: Callable, args, kwargs):
+        self.user = user
+        self.cost = cost
+        self.small = small
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.future: Future = Future()
+        self.enqueued = time.monotonic()
+        self.started: Optional[float] = None
+
+class FairScheduler:
+    def __init__(self, workers: int = SCHED_WORKERS, small_cost: float = SMALL_JOB_COST,
+                 max_wait: float = SCHED_MAX_WAIT, reserved_small: int = 1,
+                 admit_max_wait: float = ADMIT_MAX_WAIT, admit_timeout: float = ADMIT_QUEUE_TIMEOUT):
+        self.workers = max(1, workers)
+        self.small_cost = small_cost
+        self.max_wait = max_wait
+        self.large_cap = max(1, self.workers - reserved_small)
+        self.admit_max_wait = admit_max_wait
+        self.admit_timeout = admit_timeout
+        self._cv = threading.Condition()
+        self._queues: Dict[str, Dict[bool, Deque[_Job]]] = {}
+        self._vtime: Dict[str, float] = {}
+        self._clock = 0.0
+        self._running = 0
+        self._running_large = 0
+        self._active: Set[_Job] = set()
+        self._queued_cost = {True: 0.0, False: 0.0}
+        self._admitted = 0
+        self._shed = 0
+        self._admit_waiting = 0
+        for i in range(self.workers):
+            threading.Thread(target=self._loop, name=f"sched-{i}", daemon=True).start()
+
+    def _predicted_wait(self, small: bool) -> float:
+        now = time.monotonic()
+        left = {True: 0.0, False: 0.0}
+        large_left = []
+        for j in self._active:
+            rest = max(0.0, j.cost - (now - j.started))
+            left[j.small] += rest
+            if not j.small:
+                large_left.append(rest)
+        small_backlog = self._queued_cost[True] + left[True]
+        if small:
+            slots = self.workers - self._running_large
+            if slots > 0:
+                return small_backlog / slots
+            return min(large_left) + small_backlog / self.workers  # one worker, held by a large job
+        return (self._queued_cost[False] + left[False]) / self.large_cap + small_backlog / self.workers
+
+    def _over_capacity(self, small: bool) -> Optional[float]:
+        """The predicted wait when a new job of this class would be shed, else None."""
+        if self.admit_max_wait <= 0 or not (self._queues or self._running):
+            return None
+        wait = self._predicted_wait(small)
+        return wait if wait > self.admit_max_wait else None
+
+    def retry_after(self, small: bool = True) -> Optional[int]:
+        """Seconds a caller should back off for, or None while new work of the class is
+        admitted. Cheap enough to check before accepting an upload body, where the
+        cost is not known yet: the default asks whether even a small job is refused."""
+        with self._cv:
+            wait = self._over_capacity(small)
+        return None if wait is None else max(1, math.ceil(wait - self.admit_max_wait))
+
+    def submit(self, user: str, cost: float, fn: Callable, *args: Any, **kwargs: Any) -> Future:
+        job = _Job(user, cost, cost <= self.small_cost, fn, args, kwargs)
+        with self._cv:
+            wait = self._over_capacity(job.small)
+            if wait is not None and self.admit_timeout > 0:
+                deadline = time.monotonic() + self.admit_timeout
+                self._admit_waiting += 1
+                try:
+                    while wait is not None and time.monotonic() < deadline:
+                        self._cv.wait(timeout=min(1.0, deadline - time.monotonic()))
+                        wait = self._over_capacity(job.small)
+                finally:
+                    self._admit_waiting -= 1
+            if wait is not None:
+                self._shed += 1
+                raise Overloaded(max(1, math.ceil(wait - self.admit_max_wait)), wait)
+            self._admitted += 1
+            job.enqueued = time.monotonic()
+            self._queued_cost[job.small] += cost
+            self._queues.setdefault(user, {True: deque(), False: deque()})[job.small].append(job)
+            self._cv.notify()
+        return job.future
+
+    def run(self, user: str, cost: float, fn: Callable, *args: Any, **kwargs: Any) -> Any:
+        return self.submit(user, cost, fn, *args, **kwargs).result()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cv:
+            small = sum(len(q[True]) for q in self._queues.values())
+            large = sum(len(q[False]) for q in self._queues.values())
+            return {"queued_small": small, "queued_large": large, "running": self._running,
+                    "running_large": self._running_large, "workers": self.workers,
+                    "predicted_wait_small_s": round(self._predicted_wait(True), 1),
+                    "predicted_wait_large_s": round(self._predicted_wait(False), 1),
+                    "admit_max_wait_s": self.admit_max_wait,
+                    "admit_waiting": self._admit_waiting, "admitted": self._admitted, "shed": self._shed}
+
+    def _pick(self) -> Optional[_Job]:
+        heads = [q[cls][0] for q in self._queues.values() for cls in (True, False) if q[cls]]
+        can_large = self._running_large < self.large_cap
+        heads = [j for j in heads if j.small or can_large]
+        if not heads:
+            return None
+        oldest = min(heads, key=lambda j: j.enqueued)
+        if time.monotonic() - oldest.enqueued >= self.max_wait:
+            return oldest
+        small = [j for j in heads if j.small]
+        pool = small or heads
+        return min(pool, key=lambda j: (max(self._vtime.get(j.user, 0.0), self._clock), j.enqueued))
+
+    def _take(self, job: _Job) -> None:
+        queues = self._queues[job.user]
+        queues[job.small].popleft()
+        if not queues[True] and not queues[False]:
+            del self._queues[job.user]
+        start = max(self._vtime.get(job.user, 0.0), self._clock)
+        self._clock = start
+        self._vtime[job.user] = start + job.cost
+        self._queued_cost[job.small] -= job.cost
+        job.started = time.monotonic()
+        self._active.add(job)
+        self._running += 1
+        if not job.small:
+            self._running_large += 1
+
+    def _loop(self) -> None:
+        while True:
+            with self._cv:
+                job = self._pick()
+                while job is None:
+                    # bounded wait so starvation deadlines are re-checked without a notify
+                    self._cv.wait(timeout=1.0)
+                    job = self._pick()
+                self._take(job)
+            try:
+                if job.future.set_running_or_notify_cancel():
+                    job.future.set_result(job.fn(*job.args, **job.kwargs))
+            except BaseException as e:
+                job.future.set_exception(e)
+            finally:
+                with self._cv:
+                    self._active.discard(job)
+                    self._running -= 1
+                    if not job.small:
+                        self._running_large -= 1
+                    if not self._queues and not self._running:
+                        self._vtime.clear()  # idle: old usage is not held against anyone
+                        self._clock = 0.0
+                        self._queued_cost = {True: 0.0, False: 0.0}  # drop float drift
+                    self._cv.notify_all()
@@ -0,0 +1,113 @@
+"""Single-flight coordination of identical extractions across processes on one host.
+
+The first caller for a key takes an exclusive file lock and runs the extraction;
+concurrent callers block on the same lock and then read the result it left behind.
+Finished results stay readable for SINGLEFLIGHT_TTL seconds so retries that arrive
+just after completion are served too. Failures are not stored: the next waiter runs
+the extraction itself. Results are candidate text, so they live in a private_dir with
+every file 0600; when that directory is unsafe, callers run their extraction unshared.
+"""
+import hashlib, json, os, random, tempfile, threading, time
+from typing import Any, Callable, Dict, Optional, Tuple
+
+try:
+    import fcntl
+except Exception:  # Windows: coordinate threads of this process only
+    fcntl = None
+
+from private_dir import private_dir
+
+SINGLEFLIGHT_DIR = os.getenv("SINGLEFLIGHT_DIR", os.path.join(tempfile.gettempdir(), "inqous_singleflight"))
+SINGLEFLIGHT_TTL = float(os.getenv("SINGLEFLIGHT_TTL", "30"))
+SINGLEFLIGHT_WAIT = float(os.getenv("SINGLEFLIGHT_WAIT", "600"))
+
+_local_locks: Dict[str, threading.Lock] = {}
+_local_guard = threading.Lock()
+
+def flight_key(digest: str, **options: Any) -> str:
+    """Key for a content hash plus every option that changes the extraction output."""
+    raw = json.dumps({"sha256": digest, **options}, sort_keys=True, default=str)
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+def _read_fresh(path: str) -> Optional[Dict[str, Any]]:
+    try:
+        if time.time() - os.path.getmtime(path) > SINGLEFLIGHT_TTL:
+            return None
+        with open(path) as fh:
+            return json.load(fh)
+    except (OSError, ValueError):
+        return None
+
+def _private(path: str, flags: int) -> int:
+    return os.open(path, flags | os.O_CREAT, 0o600)
+
+def _write(path: str, result: Dict[str, Any]) -> None:
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with os.fdopen(_private(tmp, os.O_WRONLY | os.O_TRUNC), "w") as fh:
+            json.dump(result, fh)
+        os.replace(tmp, path)
+    except (OSError, TypeError, ValueError):
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+
+def _sweep() -> None:
+    now = time.time()
+    for name in os.listdir(SINGLEFLIGHT_DIR):
+        path = os.path.join(SINGLEFLIGHT_DIR, name)
+        # lock files are only removed long after use so a live holder is never unlinked
+        limit = SINGLEFLIGHT_TTL if name.endswith(".json") else 86400
+        try:
+            if now - os.path.getmtime(path) > limit:
+                os.remove(path)
+        except OSError:
+            pass
+
+def _flock(fh, deadline: float) -> bool:
+    while True:
+        try:
+            fcntl.flock(fh.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return True
+        except BlockingIOError:
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(0.05)
+
+def _local_lock(key: str) -> threading.Lock:
+    with _local_guard:
+        return _local_locks.setdefault(key, threading.Lock())
+
+def run(key: str, fn: Callable[[], Dict[str, Any]]) -> Tuple[Dict[str, Any], bool]:
+    """Run fn once per key among concurrent callers; returns (result, shared)."""
+    try:
+        private_dir(SINGLEFLIGHT_DIR)
+    except OSError:
+        return fn(), False  # never share results through a directory others control
+    if random.random() < 0.02:
+        _sweep()
+    result_path = os.path.join(SINGLEFLIGHT_DIR, f"{key}.json")
+
+    if fcntl is None:
+        with _local_lock(key):
+            cached = _read_fresh(result_path)
+            if cached is not None:
+                return cached, True
+            result = fn()
+            _write(result_path, result)
+            return result, False
+
+    with os.fdopen(_private(os.path.join(SINGLEFLIGHT_DIR, f"{key}.lock"), os.O_WRONLY | os.O_APPEND), "a") as lock:
+        if not _flock(lock, time.monotonic() + SINGLEFLIGHT_WAIT):
+            return fn(), False  # the leader is stuck; do not make this request wait forever
+        try:
+            os.utime(lock.fileno())
+            cached = _read_fresh(result_path)
+            if cached is not None:
+                return cached, True
+            result = fn()
+            _write(result_path, result)
+            return result, False
+        finally:
+            fcntl.flock(lock.fileno(), fcntl.LOCK_UN)
@@ -0,0 +1,61 @@
+"""Seeded CV-like text and a minimal text-layer PDF writer, standard library only.
+
+Shared by evaluate.py's golden corpus and the tests, so a test needs neither numpy,
+Pillow nor the evaluation harness to build its documents.
+"""
+import random
+from typing import List
+
+_WORDS = ("managed delivered designed built migrated reduced improved led automated analysed "
+          "data platform pipeline customer reporting service team cloud warehouse budget release "
+          "quality latency costs onboarding stakeholders requirements dashboards forecasting "
+          "Python SQL Kubernetes Terraform Spark Airflow React PostgreSQL AWS Azure "
+          "across within through for with and the of to by in").split()
+_TITLES = ["Senior Data Engineer", "Product Manager", "Software Developer", "Operations Analyst",
+           "Project Coordinator", "QA Engineer", "Solutions Architect", "Team Lead"]
+_COMPANIES = ["Norvik Logistics", "Brightwell Health", "Castell Systems", "Hollis & Marsh",
+              "Keller Retail Group", "Oakridge Energy", "Vantor Labs", "Meridian Bank"]
+
+def random_lines(rng: random.Random, n: int) -> List[str]:
+    """n CV-like lines: job headings and achievement sentences, seeded by rng."""
+    out = []
+    for _ in range(n):
+        if rng.random() < 0.2:
+            start = rng.randint(2008, 2020)
+            out.append(f"{rng.choice(_TITLES)} at {rng.choice(_COMPANIES)}, {start} - {start + rng.randint(1, 4)}")
+        else:
+            words = [rng.choice(_WORDS) for _ in range(rng.randint(6, 10))]
+            words[0] = words[0].capitalize()
+            if rng.random() < 0.3:
+                words.insert(rng.randint(1, len(words) - 1), f"{rng.randint(5, 60)}%")
+            out.append(" ".join(words) + ".")
+    return out
+
+def _pdf_escape(s: str) -> str:
+    return s.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+def text_pdf(path: str, pages: List[List[str]]) -> None:
+    """A minimal PDF with a Helvetica text layer, one line per Tj."""
+    objs = {1: b"<< /Type /Catalog /Pages 2 0 R >>",
+            3: b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>"}
+    kids = []
+    for i, lines in enumerate(pages):
+        page_no, content_no = 4 + 2 * i, 5 + 2 * i
+        ops = "BT /F1 11 Tf 16 TL 72 700 Td\n" + "".join(f"({_pdf_escape(l)}) Tj T*\n" for l in lines) + "ET"
+        stream = ops.encode("latin-1")
+        objs[page_no] = (f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Contents {content_no} 0 R"
+                         " /Resources << /Font << /F1 3 0 R >> >> >>").encode()
+        objs[content_no] = b"<< /Length %d >>\nstream\n%s\nendstream" % (len(stream), stream)
+        kids.append(f"{page_no} 0 R")
+    objs[2] = f"<< /Type /Pages /Kids [{' '.join(kids)}] /Count {len(pages)} >>".encode()
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = {}
+    for n in sorted(objs):
+        offsets[n] = len(out)
+        out += b"%d 0 obj\n%s\nendobj\n" % (n, objs[n])
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objs) + 1)
+    out += b"".join(b"%010d 00000 n \n" % offsets[n] for n in sorted(objs))
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objs) + 1, xref)
+    with open(path, "wb") as fh:
+        fh.write(out)
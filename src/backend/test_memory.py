@@ -0,0 +1,52 @@
+"""Memory ceiling of low-memory PDF extraction on a large synthetic document.
+
+    python -m pytest test_memory.py
+
+Each extraction runs in a fresh spawned interpreter, so getrusage's peak belongs to
+that run alone. MEMORY_CEILING_MB overrides the ceiling for slower or larger hosts.
+"""
+import multiprocessing as mp
+import os, random
+
+import pytest
+
+from synthetic_docs import random_lines, text_pdf
+
+MEMORY_CEILING_MB = float(os.getenv("MEMORY_CEILING_MB", "300"))
+# a 4x longer document may cost this much more: page text, not parsed page objects
+PER_PAGE_GROWTH_MB = 0.1
+
+def _extract(path: str) -> dict:
+    import resume_extractor as rx
+    text, meta, _ = rx.extract_pdf(path, "eng", low_memory=True)
+    return {"chars": len(text), **{k: meta[k] for k in ("page_count", "pages_processed", "low_memory",
+                                                         "peak_rss_mb", "max_rss_mb")}}
+
+def _run(path: str) -> dict:
+    with mp.get_context("spawn").Pool(1) as pool:
+        return pool.apply(_extract, (path,))
+
+@pytest.fixture(scope="module")
+def pdfs(tmp_path_factory):
+    rng = random.Random(28)
+    out = {}
+    for n in (100, 400):
+        path = str(tmp_path_factory.mktemp("pdf") / f"pages{n}.pdf")
+        text_pdf(path, [random_lines(rng, 40) for _ in range(n)])
+        out[n] = path
+    return out
+
+def test_large_pdf_stays_under_ceiling(pdfs):
+    meta = _run(pdfs[400])
+    assert meta["low_memory"] and meta["pages_processed"] == meta["page_count"] == 400
+    assert meta["chars"] > 0
+    if meta["max_rss_mb"] is None:
+        pytest.skip("getrusage is not available here")
+    assert max(meta["peak_rss_mb"].values()) < MEMORY_CEILING_MB
+    assert meta["max_rss_mb"] < MEMORY_CEILING_MB
+
+def test_peak_rss_does_not_scale_with_pages(pdfs):
+    small, large = _run(pdfs[100]), _run(pdfs[400])
+    if small["max_rss_mb"] is None:
+        pytest.skip("getrusage is not available here")
+    assert large["max_rss_mb"] - small["max_rss_mb"] < 300 * PER_PAGE_GROWTH_MB